@@ -3,38 +3,45 @@
 #
 # 这个文件聚合了包内所有自定义节点的映射信息，
 # 以便ComfyUI加载器可以一次性找到它们。
+#
+# 节点模块本身只包含轻量的类定义，torch / cv2 / av / comfy_api
+# 等重量级依赖在节点第一次执行时才导入（见 lazy_imports.py），因此注册节点几乎不增加启动时间。
+# 某个节点所需的依赖缺失时，只跳过该节点，其余节点照常加载。
 # --------------------------------------------------------------------------------
+import importlib
+from .lazy_imports import missing_modules
 
-# 导入每个节点文件的映射字典，并使用别名以防名称冲突
-from .text_file_iterator import NODE_CLASS_MAPPINGS as text_mappings, NODE_DISPLAY_NAME_MAPPINGS as text_display_mappings
-from .image_file_iterator import NODE_CLASS_MAPPINGS as image_mappings, NODE_DISPLAY_NAME_MAPPINGS as image_display_mappings
-from .filename_comparator import NODE_CLASS_MAPPINGS as comparator_mappings, NODE_DISPLAY_NAME_MAPPINGS as comparator_display_mappings
-from .video_file_iterator import NODE_CLASS_MAPPINGS as video_mappings, NODE_DISPLAY_NAME_MAPPINGS as video_display_mappings
-# --- 新增行 ---
-# 导入新创建的、符合ComfyUI标准的视频对象迭代器节点的映射
-from .video_object_iterator import NODE_CLASS_MAPPINGS as video_object_mappings, NODE_DISPLAY_NAME_MAPPINGS as video_object_display_mappings
-# 导入最终版本的视频转多帧迭代器
-from .video_frames_by_interval_iterator import NODE_CLASS_MAPPINGS as interval_mappings, NODE_DISPLAY_NAME_MAPPINGS as interval_display_mappings
-
-# 使用字典解包（**）将所有映射合并到一个字典中
-# 这是一种干净且可扩展的方式，未来添加新节点时只需在此处添加即可
-NODE_CLASS_MAPPINGS = {
-    **text_mappings,
-    **image_mappings,
-    **comparator_mappings,
-    **video_mappings,
-    **video_object_mappings,  # --- 新增行 ---
-    **interval_mappings,  # --- 新增行 ---
+# 节点模块 -> 运行该节点必需的依赖（只用 find_spec 检查是否存在，不会导入）
+# 可选择解码后端（OpenCV / PyAV）的视频节点不强制要求 cv2，所选后端缺失时在执行时报错并给出安装提示
+NODE_MODULES = {
+    "text_file_iterator": (),
+    "image_file_iterator": ("torch", "numpy", "PIL"),
+    "filename_comparator": (),
+    "video_file_iterator": ("torch", "numpy"),
+    # 导入符合ComfyUI标准的视频对象迭代器节点
+    "video_object_iterator": ("torch", "numpy", "av", "comfy_api"),
+    # 视频转多帧迭代器
+    "video_frames_by_interval_iterator": ("numpy", "PIL"),
+    # 图片+TXT配对迭代器
+    "paired_dataset_iterator": ("torch", "numpy", "PIL"),
 }
 
-NODE_DISPLAY_NAME_MAPPINGS = {
-    **text_display_mappings,
-    **image_display_mappings,
-    **comparator_display_mappings,
-    **video_display_mappings,
-    **video_object_display_mappings,  # --- 新增行 ---
-    **interval_display_mappings,  # --- 新增行 ---
-}
+# 将所有映射合并到一个字典中，未来添加新节点时只需在 NODE_MODULES 中添加即可
+NODE_CLASS_MAPPINGS = {}
+NODE_DISPLAY_NAME_MAPPINGS = {}
+
+for module_name, required_modules in NODE_MODULES.items():
+    missing = missing_modules(required_modules)
+    if missing:
+        print(f"⚠️ 跳过节点模块 {module_name}: 缺少依赖 {', '.join(missing)}")
+        continue
+    try:
+        module = importlib.import_module(f".{module_name}", __name__)
+    except Exception as e:
+        print(f"⚠️ 跳过节点模块 {module_name}: 加载失败 - {e}")
+        continue
+    NODE_CLASS_MAPPINGS.update(module.NODE_CLASS_MAPPINGS)
+    NODE_DISPLAY_NAME_MAPPINGS.update(module.NODE_DISPLAY_NAME_MAPPINGS)
 
 # `__all__` 定义了当其他模块使用 `from package import *` 时，
 # 应该导入哪些名称。ComfyUI会查找并使用这两个聚合后的字典。
@@ -43,5 +50,8 @@ __all__ = [
     'NODE_DISPLAY_NAME_MAPPINGS'
 ]
 
-# --- 修改打印信息以包含所有节点 ---
-print("✅ 加载自定义节点: Text/Image/Video 迭代器, 视频路径迭代器 和 文件名比较器")
\ No newline at end of file
+# --- 只列出实际注册成功的节点 ---
+if NODE_DISPLAY_NAME_MAPPINGS:
+    print(f"✅ 加载自定义节点: {', '.join(NODE_DISPLAY_NAME_MAPPINGS.values())}")
+else:
+    print("⚠️ 没有加载任何自定义节点，请检查上方缺少的依赖。")
\ No newline at end of file
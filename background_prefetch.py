@@ -0,0 +1,95 @@
+from concurrent.futures import ThreadPoolExecutor
+
+# --------------------------------------------------------------------------------
+# Class: BackgroundPrefetcher
+# 视频迭代器节点可选的流水线模式：在当前这一次执行结束后（下游采样/推理进行的同时），
+# 由一个后台线程提前处理接下来的文件，结果放入一个有界的缓冲中。
+# 下一次执行时如果结果已经准备好（或正在准备），直接取出，不再重复处理。
+#
+# - 深度（depth）限制最多提前准备多少个文件；
+# - 内存上限按已完成结果的实际大小计算（未完成的按最近一个结果的大小估算），超出时不再提交新任务；
+#   还不知道结果大小时只提交一个任务；
+# - 任务按文件名与参数校验，迭代位置或参数改变时旧结果会被丢弃，输出顺序与终止逻辑保持不变；
+# - 后台任务中的异常会在取出结果时原样抛出，与同步加载时的行为一致。
+# --------------------------------------------------------------------------------
+class BackgroundPrefetcher:
+    def __init__(self, name, size_fn=None):
+        self.name = name
+        # size_fn(结果) 返回结果占用的字节数，用于内存上限
+        self.size_fn = size_fn
+        self._executor = None
+        # {文件索引: (文件名, Future)}
+        self._futures = {}
+        self._params = None
+        self._last_size = 0
+
+    def reset(self):
+        """丢弃所有预先准备的结果，尚未开始的任务会被取消。"""
+        for _, future in self._futures.values():
+            future.cancel()
+        self._futures = {}
+
+    def _check_params(self, params):
+        if params != self._params:
+            self.reset()
+            self._params = params
+            return False
+        return True
+
+    def take(self, index, name, params):
+        """
+        取出为第 index 个文件 name 预先提交的任务（Future）；没有可用的任务时返回 None。
+        params 为影响结果的全部参数，与提交时不同则丢弃所有旧结果。
+        """
+        if not self._check_params(params):
+            return None
+        entry = self._futures.pop(index, None)
+        if entry is None:
+            return None
+        entry_name, future = entry
+        if entry_name != name:
+            future.cancel()
+            return None
+        return future
+
+    def _record_size(self, future):
+        """任务完成时记录结果大小（在后台线程中调用）。"""
+        if self.size_fn is None or future.cancelled() or future.exception() is not None:
+            return
+        self._last_size = self.size_fn(future.result())
+
+    def _held_bytes(self):
+        held = 0
+        for _, future in self._futures.values():
+            if future.done() and not future.cancelled() and future.exception() is None:
+                held += self.size_fn(future.result())
+            else:
+                held += self._last_size
+        return held
+
+    def schedule(self, upcoming, load_fn, params, depth, max_memory_mb=0):
+        """
+        保证 upcoming（按处理顺序排列的 [(索引, 文件名)]）中前 depth 个文件已提交到后台线程，
+        load_fn(文件名) 在后台线程中按提交顺序执行。
+        """
+        self._check_params(params)
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=self.name)
+
+        upcoming = list(upcoming)[:depth]
+        # 清理不再属于接下来 depth 个文件的结果（例如迭代位置被跳转）
+        wanted = dict(upcoming)
+        for index in [i for i, (name, _) in self._futures.items() if wanted.get(i) != name]:
+            self._futures.pop(index)[1].cancel()
+
+        limited = max_memory_mb > 0 and self.size_fn is not None
+        budget_bytes = max_memory_mb * 1024 * 1024
+        for index, name in upcoming:
+            if index in self._futures:
+                continue
+            if limited and self._futures:
+                if self._last_size == 0 or self._held_bytes() + self._last_size > budget_bytes:
+                    break
+            future = self._executor.submit(load_fn, name)
+            future.add_done_callback(self._record_size)
+            self._futures[index] = (name, future)
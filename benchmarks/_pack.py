@@ -0,0 +1,21 @@
+# --------------------------------------------------------------------------------
+# _pack.py
+# 基准测试脚本共用：把节点包注册为 "iterator_nodes" 以便导入其中的模块。
+# 节点包目录名通常含有 "-"，不能直接 import；这里不执行 __init__.py，因此不会注册节点或打印日志。
+# --------------------------------------------------------------------------------
+import importlib
+import os
+import sys
+import types
+
+PACK_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PACK_NAME = "iterator_nodes"
+
+
+def load_pack_module(module_name):
+    """导入节点包中的一个模块，例如 load_pack_module("frame_utils")。"""
+    if PACK_NAME not in sys.modules:
+        package = types.ModuleType(PACK_NAME)
+        package.__path__ = [PACK_ROOT]
+        sys.modules[PACK_NAME] = package
+    return importlib.import_module(f"{PACK_NAME}.{module_name}")
@@ -0,0 +1,89 @@
+# --------------------------------------------------------------------------------
+# bench_frame_memory.py
+# 比较把解码得到的 uint8 帧组装成 float32 [N, H, W, C] 张量时的峰值内存（RSS）：
+# - astype_stack:  逐帧 astype(np.float32) / 255.0，再 torch.stack（旧的视频加载路径）
+# - uint8_stack:   先 np.stack 成 uint8，再整体转换为 float32（旧的另一条路径）
+# - builder:       frame_utils.FrameTensorBuilder，逐帧写入预分配的张量并原地归一化
+# 每种方式在独立的子进程中运行（ru_maxrss 只增不减），输出峰值 RSS 相对导入 torch 之后的增量。
+# 帧内容为随机噪声，不解码真实视频，只衡量转换本身的内存开销。
+#
+# 用法: python benchmarks/bench_frame_memory.py [--frames 600 --width 1920 --height 1080]
+# 注意：默认参数（1080p、600 帧）下 float32 输出本身约 14.9 GB，旧路径的峰值约为其 2 倍，
+#       内存不足时请减少 --frames。resource 模块只在 Linux / macOS 上可用。
+# --------------------------------------------------------------------------------
+import argparse
+import resource
+import subprocess
+import sys
+
+MODES = ("astype_stack", "uint8_stack", "builder")
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 上单位为 KB，macOS 上为字节
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def decoded_frames(frames, width, height):
+    """模拟解码器：每次产出同一块 uint8 缓冲区（与 video_backend 复用缓冲区的行为一致）。"""
+    import numpy as np
+    buffer = np.random.randint(0, 256, (height, width, 3), dtype=np.uint8)
+    for _ in range(frames):
+        yield buffer
+
+
+def run_mode(mode, frames, width, height):
+    import numpy as np
+    import torch
+    from _pack import load_pack_module
+
+    frame_utils = load_pack_module("frame_utils")
+    baseline = peak_rss_mb()
+
+    if mode == "astype_stack":
+        float_frames = [torch.from_numpy(f.astype(np.float32) / 255.0) for f in decoded_frames(frames, width, height)]
+        result = torch.stack(float_frames)
+        del float_frames
+    elif mode == "uint8_stack":
+        uint8_frames = np.stack([f.copy() for f in decoded_frames(frames, width, height)])
+        result = torch.from_numpy(uint8_frames.astype(np.float32) / 255.0)
+        del uint8_frames
+    else:
+        builder = frame_utils.FrameTensorBuilder(frames, torch.float32)
+        for f in decoded_frames(frames, width, height):
+            builder.append(f)
+        result = builder.result()
+
+    output_mb = result.numel() * result.element_size() / (1024 * 1024)
+    print(f"RESULT {peak_rss_mb() - baseline:.1f} {output_mb:.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="比较帧张量组装方式的峰值内存")
+    parser.add_argument("--frames", type=int, default=600)
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--mode", choices=MODES, help="只运行一种方式（内部使用）")
+    args = parser.parse_args()
+
+    if args.mode:
+        run_mode(args.mode, args.frames, args.width, args.height)
+        return
+
+    print(f"{args.frames} 帧 {args.width}x{args.height}，峰值 RSS 增量（相对导入 torch 之后）:")
+    for mode in MODES:
+        proc = subprocess.run([sys.executable, __file__, "--mode", mode, "--frames", str(args.frames),
+                               "--width", str(args.width), "--height", str(args.height)], capture_output=True, text=True)
+        result_line = next((line for line in proc.stdout.splitlines() if line.startswith("RESULT")), None)
+        if proc.returncode != 0 or result_line is None:
+            error = proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else f"退出码 {proc.returncode}"
+            print(f"  {mode:<13} 失败: {error}")
+            continue
+        _, peak_mb, output_mb = result_line.split(" ")
+        ratio = float(peak_mb) / float(output_mb) if float(output_mb) > 0 else 0
+        print(f"  {mode:<13} 峰值 {float(peak_mb):10.1f} MB  输出 {float(output_mb):10.1f} MB  ({ratio:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
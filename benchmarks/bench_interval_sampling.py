@@ -0,0 +1,129 @@
+# --------------------------------------------------------------------------------
+# bench_interval_sampling.py
+# 在合成视频上比较按帧间隔取帧的两种方式（见 VideoFramesByIntervalIteratorNode._sample_frames）：
+# - sequential: 顺序解码，不需要的帧只 grab，保留的帧才 retrieve 并转换颜色
+# - seek:       每个采样点跳转一次（长 GOP 时每次都要从前一个关键帧重新解码）
+# 同时输出 auto 模式会选择的方式，用于检查 _choose_sampling_strategy 的阈值。
+#
+# 合成视频用 OpenCV 写入；安装了 PyAV 时改用 libx264 并按 --gops 指定关键帧间隔
+# （OpenCV 的 VideoWriter 无法设置 GOP，此时只生成一个 mp4v 视频）。
+#
+# 用法: python benchmarks/bench_interval_sampling.py [--frames 1800 --gops 12,250 --intervals 1,5,15,30,60,120,300]
+# --------------------------------------------------------------------------------
+import argparse
+import os
+import tempfile
+import time
+
+from _pack import load_pack_module
+
+
+def synthetic_frame(np, idx, width, height):
+    """带移动方块和噪声的画面，让编码器产生真实的 P/B 帧。"""
+    y, x = np.mgrid[0:height, 0:width]
+    frame = np.empty((height, width, 3), dtype=np.uint8)
+    frame[..., 0] = (x + idx * 3) % 256
+    frame[..., 1] = (y + idx * 2) % 256
+    frame[..., 2] = (x + y + idx) % 256
+    size = height // 4
+    left = (idx * 7) % max(width - size, 1)
+    top = (idx * 5) % max(height - size, 1)
+    frame[top:top + size, left:left + size] = 255
+    frame += np.random.randint(0, 8, frame.shape, dtype=np.uint8)
+    return frame
+
+
+def write_clip_pyav(av, np, path, frames, width, height, fps, gop):
+    with av.open(path, "w") as container:
+        stream = container.add_stream("libx264", rate=fps)
+        stream.width = width
+        stream.height = height
+        stream.pix_fmt = "yuv420p"
+        stream.codec_context.gop_size = gop
+        stream.options = {"keyint": str(gop), "min-keyint": str(gop), "scenecut": "0"}
+        for idx in range(frames):
+            frame = av.VideoFrame.from_ndarray(synthetic_frame(np, idx, width, height), format="rgb24")
+            for packet in stream.encode(frame):
+                container.mux(packet)
+        for packet in stream.encode():
+            container.mux(packet)
+
+
+def write_clip_opencv(cv2, np, path, frames, width, height, fps):
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+    if not writer.isOpened():
+        raise IOError(f"无法写入合成视频: {path}")
+    for idx in range(frames):
+        writer.write(cv2.cvtColor(synthetic_frame(np, idx, width, height), cv2.COLOR_RGB2BGR))
+    writer.release()
+
+
+def make_clips(args, folder):
+    """返回 [(描述, 路径, GOP 大小或 0)]。"""
+    import numpy as np
+    try:
+        import av
+    except ImportError:
+        av = None
+
+    clips = []
+    if av is not None:
+        for gop in args.gops:
+            path = os.path.join(folder, f"gop{gop}.mp4")
+            write_clip_pyav(av, np, path, args.frames, args.width, args.height, args.fps, gop)
+            clips.append((f"libx264 GOP={gop}", path, gop))
+    else:
+        import cv2
+        path = os.path.join(folder, "mp4v.mp4")
+        write_clip_opencv(cv2, np, path, args.frames, args.width, args.height, args.fps)
+        clips.append(("mp4v (GOP 由 OpenCV 决定)", path, 0))
+    return clips
+
+
+def time_strategy(node, video_backend, path, backend, interval, max_frames, strategy, repeats):
+    """返回 (最短耗时秒数, 取到的帧数)。"""
+    best = None
+    count = 0
+    for _ in range(repeats):
+        with video_backend.open_video(path, backend) as reader:
+            start = time.perf_counter()
+            count = sum(1 for _ in node._sample_frames(reader, interval, max_frames, strategy))
+            elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="比较 sequential / seek 两种按间隔取帧方式的耗时")
+    parser.add_argument("--frames", type=int, default=1800, help="合成视频的帧数")
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--gops", type=lambda s: [int(v) for v in s.split(",")], default=[12, 250])
+    parser.add_argument("--intervals", type=lambda s: [int(v) for v in s.split(",")], default=[1, 5, 15, 30, 60, 120, 300])
+    parser.add_argument("--max-frames", type=int, default=5, help="每个视频最多取多少帧（与节点的 max_frames_to_extract 相同）")
+    parser.add_argument("--backend", choices=["opencv", "pyav"], default="opencv")
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    node_module = load_pack_module("video_frames_by_interval_iterator")
+    video_backend = load_pack_module("video_backend")
+    node = node_module.VideoFramesByIntervalIteratorNode()
+
+    with tempfile.TemporaryDirectory() as folder:
+        print(f"正在生成 {args.frames} 帧 {args.width}x{args.height} 的合成视频...")
+        for label, path, gop in make_clips(args, folder):
+            print(f"\n{label}，后端 {args.backend}，每个视频取 {args.max_frames} 帧（取 {args.repeats} 次中的最短耗时）")
+            print(f"  {'间隔':>6}  {'sequential':>12}  {'seek':>12}  {'更快':>10}  {'auto 选择':>10}")
+            for interval in args.intervals:
+                seq_time, seq_count = time_strategy(node, video_backend, path, args.backend, interval, args.max_frames, "sequential", args.repeats)
+                seek_time, seek_count = time_strategy(node, video_backend, path, args.backend, interval, args.max_frames, "seek", args.repeats)
+                with video_backend.open_video(path, args.backend) as reader:
+                    auto = node._choose_sampling_strategy(reader, interval, "auto", gop)
+                faster = "sequential" if seq_time <= seek_time else "seek"
+                note = "" if seq_count == seek_count else f"  (帧数不同: {seq_count} / {seek_count})"
+                print(f"  {interval:>6}  {seq_time * 1000:>10.1f}ms  {seek_time * 1000:>10.1f}ms  {faster:>10}  {auto:>10}{note}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+# --------------------------------------------------------------------------------
+# check_import_time.py
+# 检查注册节点（ComfyUI 启动时导入本节点包）的开销：
+# 在一个全新的解释器中用 -X importtime 导入节点包，输出包的导入耗时与最慢的几个导入项，
+# 并检查 torch / cv2 / av / numpy 没有在注册阶段被导入（它们应在节点第一次执行时才导入）。
+#
+# 用法: python benchmarks/check_import_time.py [--max-ms 200]
+# 不满足条件时以非零状态码退出，可直接用于 CI。
+# --------------------------------------------------------------------------------
+import argparse
+import os
+import subprocess
+import sys
+
+PACK_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ("torch", "cv2", "av", "numpy")
+
+# 节点包目录名通常含有 "-"，不能直接 import，因此按 ComfyUI 的方式从 __init__.py 加载
+LOAD_PACK = f"""
+import importlib.util, sys, time
+spec = importlib.util.spec_from_file_location("iterator_nodes", {os.path.join(PACK_ROOT, "__init__.py")!r},
+                                              submodule_search_locations=[{PACK_ROOT!r}])
+module = importlib.util.module_from_spec(spec)
+sys.modules["iterator_nodes"] = module
+start = time.perf_counter()
+spec.loader.exec_module(module)
+elapsed_ms = (time.perf_counter() - start) * 1000
+print("RESULT", elapsed_ms, ",".join(m for m in {HEAVY_MODULES!r} if m in sys.modules), len(module.NODE_CLASS_MAPPINGS))
+"""
+
+
+def parse_importtime(stderr):
+    """解析 -X importtime 的输出，返回 [(累计微秒, 模块名)]。"""
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        entries.append((int(cumulative), name.strip()))
+    return entries
+
+
+def main():
+    parser = argparse.ArgumentParser(description="检查节点包的导入开销")
+    parser.add_argument("--max-ms", type=float, default=200.0, help="允许的最长导入时间（毫秒）")
+    parser.add_argument("--top", type=int, default=10, help="输出最慢的前 N 个导入项")
+    args = parser.parse_args()
+
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", LOAD_PACK], capture_output=True, text=True)
+    result_line = next((line for line in proc.stdout.splitlines() if line.startswith("RESULT")), None)
+    if proc.returncode != 0 or result_line is None:
+        print(proc.stdout)
+        print(proc.stderr)
+        sys.exit("导入节点包失败。")
+
+    fields = result_line.split(" ")
+    elapsed_ms, heavy, node_count = float(fields[1]), fields[2], int(fields[3])
+    print(f"注册了 {node_count} 个节点，节点包导入耗时 {elapsed_ms:.1f} ms")
+    print(f"最慢的 {args.top} 个导入项（累计时间）:")
+    for cumulative, name in sorted(parse_importtime(proc.stderr), reverse=True)[:args.top]:
+        print(f"  {cumulative / 1000:8.1f} ms  {name}")
+
+    failures = []
+    if heavy:
+        failures.append(f"注册阶段导入了重量级依赖: {heavy}")
+    if elapsed_ms > args.max_ms:
+        failures.append(f"导入耗时 {elapsed_ms:.1f} ms 超过上限 {args.max_ms:.1f} ms")
+    if failures:
+        sys.exit("；".join(failures))
+    print("OK: 注册阶段没有导入 " + " / ".join(HEAVY_MODULES))
+
+
+if __name__ == "__main__":
+    main()
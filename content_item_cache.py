@@ -0,0 +1,123 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+
+logger = logging.getLogger('ContentItemCache')
+
+# --------------------------------------------------------------------------------
+# Class: ContentItemCache
+# 按内容寻址的磁盘缓存，保存从视频中抽取并编码好的帧（base64 数据）。
+# 缓存键由视频路径、文件大小、修改时间以及所有影响输出的抽帧参数组成，
+# 因此视频被替换或参数改变时会自然失效。
+# 缓存总大小超过上限时，按最近访问时间（文件 mtime）淘汰最旧的条目（LRU）。
+# 总大小只在首次写入和估算值超过上限时扫描目录得到，其余写入只累加估算值。
+# --------------------------------------------------------------------------------
+class ContentItemCache:
+    def __init__(self, cache_dir, max_size_mb=1024):
+        self.cache_dir = cache_dir
+        self.max_size_bytes = max_size_mb * 1024 * 1024
+        self.hits = 0
+        self.misses = 0
+        # 上次扫描得到的总大小加上之后写入的条目大小；None 表示尚未扫描
+        self._approx_size = None
+        self._size_lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(video_path, **params):
+        """
+        根据视频文件的身份（绝对路径、大小、修改时间）与抽帧参数生成缓存键。
+        """
+        stat = os.stat(video_path)
+        identity = [os.path.abspath(video_path), stat.st_size, stat.st_mtime_ns, sorted(params.items())]
+        return hashlib.sha256(json.dumps(identity, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key):
+        """
+        返回缓存的条目 {"mime_type": ..., "frames": [base64, ...]}，未命中时返回 None。
+        """
+        path = self._entry_path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            self.misses += 1
+            logger.info(f"[ContentItemCache] 未命中 (命中 {self.hits} / 未命中 {self.misses})")
+            return None
+
+        # 更新修改时间作为最近访问时间，供 LRU 淘汰使用
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        self.hits += 1
+        logger.info(f"[ContentItemCache] 命中 (命中 {self.hits} / 未命中 {self.misses})")
+        return entry
+
+    def put(self, key, mime_type, frames):
+        """
+        原子地写入一个条目，然后按需淘汰旧条目。
+        """
+        path = self._entry_path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({"mime_type": mime_type, "frames": frames}, f)
+                size = f.tell()
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"[ContentItemCache] 写入缓存失败: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+
+        with self._size_lock:
+            if self._approx_size is not None and self._approx_size + size <= self.max_size_bytes:
+                self._approx_size += size
+                return
+            self.evict()
+
+    def evict(self):
+        """
+        扫描缓存目录；总大小超过上限时，从最久未访问的条目开始删除。
+        """
+        entries = []
+        total_size = 0
+        try:
+            with os.scandir(self.cache_dir) as it:
+                for entry in it:
+                    # 条目可能在扫描期间被其他线程或进程删除
+                    try:
+                        if not (entry.name.endswith('.json') and entry.is_file()):
+                            continue
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    total_size += stat.st_size
+        except OSError as e:
+            logger.warning(f"[ContentItemCache] 扫描缓存目录失败: {e}")
+            return
+
+        self._approx_size = total_size
+        if total_size <= self.max_size_bytes:
+            return
+
+        entries.sort()
+        removed = 0
+        for _, size, path in entries:
+            if total_size <= self.max_size_bytes:
+                break
+            try:
+                os.remove(path)
+                total_size -= size
+                removed += 1
+            except OSError:
+                continue
+        self._approx_size = total_size
+        logger.info(f"[ContentItemCache] 已淘汰 {removed} 个旧条目，当前缓存大小 {total_size / (1024 * 1024):.1f} MB")
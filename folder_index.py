@@ -0,0 +1,303 @@
+import os
+import re
+import time
+import fnmatch
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+# --------------------------------------------------------------------------------
+# folder_index
+# 所有迭代器节点共用的文件夹索引。
+# 只用一次 os.scandir 遍历目录（不对文件逐个 stat，文件大小与修改时间在访问时才读取），
+# 扩展名匹配不区分大小写（.JPG / .MP4 等不会被漏掉）。
+# 扫描结果按 (文件夹, 目录修改时间) 在进程内共享，
+# 同一个工作流中多个节点指向同一文件夹时只会真正扫描一次。
+# 目录修改时间的精度有限（部分文件系统为 1~2 秒），扫描时修改时间距今不足 RACY_WINDOW_NS 的结果
+# 不会被复用：同一时间粒度内紧接着新增的文件不会改变修改时间，复用会漏掉它们。
+#
+# 递归模式（ScanOptions.recursive）按层并发地扫描所有子文件夹（对 NFS 等高延迟存储更快），
+# 每个子文件夹同样按目录修改时间缓存，重复扫描时只需对每个目录 stat 一次。
+# 递归模式下返回的文件名是相对于 folder_path 的路径（如 2024-01-01/cam1/0001.jpg），
+# 不同子文件夹中的同名文件因此不会冲突；排序按完整的相对路径进行，结果与扫描顺序无关。
+# --------------------------------------------------------------------------------
+
+IMAGE_EXTENSIONS = frozenset({'.png', '.jpg', '.jpeg', '.webp', '.bmp'})
+VIDEO_EXTENSIONS = frozenset({'.mp4', '.mov', '.avi', '.mkv', '.webm'})
+TEXT_EXTENSIONS = frozenset({'.txt'})
+
+class FileEntry(namedtuple('FileEntry', ['name', 'path'])):
+    """
+    目录中的一个文件。扫描时只记录名称与路径：在 NFS 等存储上每次 stat 都是一次网络往返，
+    大目录中逐个 stat 会比扫描本身慢得多，因此 size / mtime 只在访问时才 stat。
+    """
+    __slots__ = ()
+
+    @property
+    def size(self):
+        return os.stat(self.path).st_size
+
+    @property
+    def mtime(self):
+        return os.stat(self.path).st_mtime
+
+# 递归扫描选项：
+# - include / exclude: 逗号分隔的通配符（如 "cam1/*, *.mp4"，不区分大小写），含 "/" 的模式匹配相对路径，否则匹配文件名；
+#   exclude 同样作用于子文件夹，被排除的子文件夹不会被扫描
+# - max_depth: 最多进入几层子文件夹，0 表示不限制
+ScanOptions = namedtuple('ScanOptions', ['recursive', 'include', 'exclude', 'max_depth'], defaults=(False, "", "", 0))
+
+# 递归扫描时并发执行 scandir 的线程数（I/O 密集，不受 CPU 核数限制）
+SCAN_WORKERS = 16
+_scan_executor = None
+_scan_executor_lock = threading.Lock()
+
+# 目录修改时间与扫描时间相差不足该值时，认为扫描结果可能不完整（纳秒）
+RACY_WINDOW_NS = 2 * 10**9
+# 扫描缓存最多保留的目录数，超出时淘汰最久未使用的目录
+SCAN_CACHE_MAX_DIRS = 4096
+
+# {文件夹绝对路径: (目录修改时间, 扫描时间, entries, subdirs)}，按最近使用排序
+_scan_cache = {}
+_scan_cache_lock = threading.Lock()
+
+
+def natural_sort_key(name):
+    """
+    自然排序键：把文件名中的数字按数值比较，例如 img2 排在 img10 之前。
+    """
+    return [(0, int(part), '') if part.isdigit() else (1, 0, part.lower()) for part in re.split(r'(\d+)', name)]
+
+
+def _is_racy(dir_mtime_ns, scan_time_ns):
+    """扫描时目录刚被修改过：之后的修改可能不会改变目录修改时间，不能只凭修改时间判断是否变化。"""
+    return scan_time_ns - dir_mtime_ns < RACY_WINDOW_NS
+
+
+def _scan_dir(folder_path):
+    """
+    遍历一次目录，返回 (其中所有普通文件的 FileEntry, 子文件夹名)。
+    结果按目录的修改时间缓存；目录内有文件增删时修改时间会变化，缓存随之失效。
+    以 "." 开头的子文件夹（状态文件、缓存等）与指向目录的符号链接不会被递归扫描。
+    """
+    folder_key = os.path.abspath(folder_path)
+    dir_mtime = os.stat(folder_key).st_mtime_ns
+
+    with _scan_cache_lock:
+        cached = _scan_cache.pop(folder_key, None)
+        if cached is not None and cached[0] == dir_mtime and not _is_racy(dir_mtime, cached[1]):
+            _scan_cache[folder_key] = cached
+            return cached[2], cached[3]
+
+    scan_time = time.time_ns()
+
+    entries = []
+    subdirs = []
+    with os.scandir(folder_key) as it:
+        for entry in it:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if not entry.name.startswith('.'):
+                        subdirs.append(entry.name)
+                    continue
+                # 大多数平台上 is_dir / is_file 直接使用 scandir 返回的类型信息，不需要额外的 stat
+                if not entry.is_file():
+                    continue
+            except OSError:
+                # 遍历过程中被删除或无权限的文件直接跳过
+                continue
+            entries.append(FileEntry(entry.name, entry.path))
+
+    entries = tuple(entries)
+    subdirs = tuple(subdirs)
+    with _scan_cache_lock:
+        _scan_cache.pop(folder_key, None)
+        _scan_cache[folder_key] = (dir_mtime, scan_time, entries, subdirs)
+        while len(_scan_cache) > SCAN_CACHE_MAX_DIRS:
+            del _scan_cache[next(iter(_scan_cache))]
+    return entries, subdirs
+
+
+def _scan_all_files(folder_path):
+    """返回目录中所有普通文件的 FileEntry（不递归）。"""
+    return _scan_dir(folder_path)[0]
+
+
+def _split_patterns(patterns):
+    """模式统一转为小写，与扩展名一样不区分大小写（*.jpg 也匹配 a.JPG）。"""
+    return [p.strip().replace('\\', '/').lower() for p in patterns.split(',') if p.strip()]
+
+
+def _matches_any(rel_path, patterns):
+    """rel_path 使用 "/" 分隔；含 "/" 的模式匹配整个相对路径，否则只匹配最后一级名称。"""
+    rel_path = rel_path.lower()
+    base_name = rel_path.rsplit('/', 1)[-1]
+    return any(fnmatch.fnmatchcase(rel_path if '/' in p else base_name, p) for p in patterns)
+
+
+def _get_scan_executor():
+    """所有递归扫描共用一个线程池（按需创建），避免每次扫描都创建和销毁线程。"""
+    global _scan_executor
+    with _scan_executor_lock:
+        if _scan_executor is None:
+            _scan_executor = ThreadPoolExecutor(max_workers=SCAN_WORKERS, thread_name_prefix="FolderIndexScan")
+        return _scan_executor
+
+
+def _scan_tree(folder_path, exclude, max_depth):
+    """
+    按层并发扫描 folder_path 及其子文件夹，返回 FileEntry，name 为以 os.sep 分隔的相对路径。
+    同一层的所有子文件夹由线程池并发 scandir，高延迟存储上的总耗时约为层数而不是文件夹数。
+    """
+    results = []
+    level = ['']
+    depth = 0
+    executor = _get_scan_executor()
+    while level:
+        scans = executor.map(_try_scan_dir, [os.path.join(folder_path, rel_dir) for rel_dir in level])
+        next_level = []
+        for rel_dir, scan in zip(level, scans):
+            if scan is None:
+                continue
+            entries, subdirs = scan
+            prefix = rel_dir + '/' if rel_dir else ''
+            for e in entries:
+                results.append(e._replace(name=prefix + e.name))
+            if max_depth <= 0 or depth < max_depth:
+                next_level.extend(prefix + d for d in subdirs if not _matches_any(prefix + d, exclude))
+        level = next_level
+        depth += 1
+    if os.sep != '/':
+        results = [e._replace(name=e.name.replace('/', os.sep)) for e in results]
+    return results
+
+
+def _try_scan_dir(folder_path):
+    """扫描期间被删除或无权限访问的子文件夹返回 None，而不是让整个扫描失败。"""
+    try:
+        return _scan_dir(folder_path)
+    except OSError:
+        return None
+
+
+def list_files(folder_path, extensions, natural_sort=False, scan_options=None):
+    """
+    返回文件夹中扩展名属于 extensions（不区分大小写）的文件，已排序。
+    natural_sort 为 True 时使用自然排序，否则按文件名的字符串顺序排序。
+    scan_options（ScanOptions）可开启递归扫描与 include / exclude 过滤。
+    """
+    if not os.path.isdir(folder_path):
+        raise NotADirectoryError(f"路径 '{folder_path}' 不是一个有效的文件夹。")
+
+    scan_options = scan_options or ScanOptions()
+    include = _split_patterns(scan_options.include)
+    exclude = _split_patterns(scan_options.exclude)
+    if scan_options.recursive:
+        entries = _scan_tree(folder_path, exclude, scan_options.max_depth)
+    else:
+        entries = _scan_all_files(folder_path)
+
+    extensions = {ext.lower() for ext in extensions}
+    matched = [e for e in entries if os.path.splitext(e.name)[1].lower() in extensions]
+    if include or exclude:
+        def selected(name):
+            rel_path = name.replace(os.sep, '/')
+            return (not include or _matches_any(rel_path, include)) and not _matches_any(rel_path, exclude)
+        matched = [e for e in matched if selected(e.name)]
+    if natural_sort:
+        matched.sort(key=lambda e: natural_sort_key(e.name))
+    else:
+        matched.sort(key=lambda e: e.name)
+    return matched
+
+
+def list_file_names(folder_path, extensions, natural_sort=False, scan_options=None):
+    """与 list_files 相同，但只返回文件名（递归时为相对路径）列表。"""
+    return [e.name for e in list_files(folder_path, extensions, natural_sort, scan_options)]
+
+
+class FolderWatcher:
+    """
+    增量监视文件夹中新出现的文件（watch 模式）。
+    只有当目录修改时间变化（或上次扫描时目录刚被修改过，见 _is_racy）时才重新扫描，并与已知文件集合做差集；
+    新文件需在 settle_seconds 内没有再被修改才会被接受，避免读取仍在写入中的文件。
+    递归模式下子文件夹中的增删不会改变顶层目录的修改时间，因此每次都重新扫描
+    （未变化的子文件夹命中扫描缓存，只需 stat 一次）。
+    """
+    def __init__(self, folder_path, extensions, known_names, natural_sort=False, settle_seconds=2.0, scan_options=None):
+        self.folder_path = folder_path
+        self.extensions = extensions
+        self.natural_sort = natural_sort
+        self.scan_options = scan_options or ScanOptions()
+        self.settle_seconds = settle_seconds
+        self.known = set(known_names)
+        self.pending = set()
+        self.last_dir_mtime = os.stat(folder_path).st_mtime_ns
+        self.last_scan_time = time.time_ns()
+
+    @classmethod
+    def append_new_files(cls, watcher, node_name, folder_path, extensions, files, natural_sort, block, watch_timeout, scan_options=None):
+        """
+        节点的监视模式：把文件夹中新出现的文件追加到 files 末尾（原地追加，不会重新扫描已知文件），
+        返回 (监视器, files)；文件夹或扫描选项改变时会新建监视器。
+        block 为 True 时阻塞轮询，直到出现新文件或超过 watch_timeout 秒。
+        """
+        scan_options = scan_options or ScanOptions()
+        if watcher is None or watcher.folder_path != folder_path or watcher.natural_sort != natural_sort \
+                or watcher.scan_options != scan_options:
+            watcher = cls(folder_path, extensions, files, natural_sort, scan_options=scan_options)
+        if block:
+            print(f"[{node_name}] 监视模式: 队列已处理完，等待新文件（最长 {watch_timeout} 秒）...")
+            new_files = watcher.wait_for_new_files(watch_timeout)
+        else:
+            new_files = watcher.poll()
+        if new_files:
+            print(f"[{node_name}] 监视模式: 发现 {len(new_files)} 个新文件。")
+            files.extend(new_files)
+        return watcher, files
+
+    def poll(self):
+        """
+        返回自上次调用以来新出现且已写入完成的文件名（已排序）。
+        """
+        dir_mtime = os.stat(self.folder_path).st_mtime_ns
+        if dir_mtime != self.last_dir_mtime or _is_racy(dir_mtime, self.last_scan_time) or self.scan_options.recursive:
+            self.last_dir_mtime = dir_mtime
+            self.last_scan_time = time.time_ns()
+            for entry in list_files(self.folder_path, self.extensions, self.natural_sort, self.scan_options):
+                if entry.name not in self.known:
+                    self.pending.add(entry.name)
+
+        if not self.pending:
+            return []
+
+        now = time.time()
+        ready = []
+        for name in list(self.pending):
+            try:
+                mtime = os.stat(os.path.join(self.folder_path, name)).st_mtime
+            except OSError:
+                # 文件在被接受前又被删除
+                self.pending.discard(name)
+                continue
+            if now - mtime >= self.settle_seconds:
+                ready.append(name)
+                self.pending.discard(name)
+                self.known.add(name)
+
+        ready.sort(key=natural_sort_key if self.natural_sort else None)
+        return ready
+
+    def wait_for_new_files(self, timeout, poll_interval=1.0):
+        """
+        阻塞轮询，直到出现新文件或超时（秒）。返回新文件名列表，超时返回空列表。
+        """
+        deadline = time.time() + timeout
+        while True:
+            ready = self.poll()
+            if ready:
+                return ready
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return []
+            time.sleep(min(poll_interval, remaining))
@@ -0,0 +1,110 @@
+# --------------------------------------------------------------------------------
+# frame_utils
+# 各个加载节点共用的 uint8 -> float32 转换工具。
+# 解码结果（uint8）直接写入预先分配好的 float32 张量，并在原地完成归一化，
+# 避免 `astype(np.float32) / 255.0` 与 `torch.stack` 产生的额外整份拷贝。
+# 视频节点也可以直接输出 float16 或保留 uint8，帧内存分别减少到 1/2 与 1/4。
+# torch / numpy 在函数内部导入，加载节点时不会拖慢 ComfyUI 启动。
+# --------------------------------------------------------------------------------
+
+# 节点 output_dtype 选项的取值
+OUTPUT_DTYPES = ("float32", "float16", "uint8")
+
+
+def resolve_dtype(name):
+    """把 output_dtype 选项转换为对应的 torch 张量类型。"""
+    import torch
+    if name not in OUTPUT_DTYPES:
+        raise ValueError(f"不支持的输出精度: '{name}'")
+    return getattr(torch, name)
+
+
+def uint8_to_float_tensor(array, out=None, dtype=None):
+    """
+    将 uint8 的 HWC（或 NHWC）数组转换为 [0, 1] 范围的浮点张量（默认 float32）。
+    如果提供了 out，结果会直接写入 out（形状必须一致），不会分配新的整份内存。
+    """
+    import numpy as np
+    import torch
+    source = torch.from_numpy(np.ascontiguousarray(array))
+    if out is None:
+        out = torch.empty(source.shape, dtype=dtype or torch.float32)
+    out.copy_(source)
+    out.div_(255.0)
+    return out
+
+
+def widen_frames(frames):
+    """
+    把以 uint8 保存的帧转换为 [0, 1] 范围的 float32 张量；浮点张量原样返回。
+    每次调用都会生成新的张量，调用方不应长期持有结果。
+    """
+    import torch
+    if frames is None or frames.dtype != torch.uint8:
+        return frames
+    return frames.to(torch.float32).div_(255.0)
+
+
+def frames_to_uint8(frames):
+    """把帧张量（可以是切片视图）转换为连续的 uint8 NHWC numpy 数组（用于编码保存）。"""
+    import torch
+    if frames.dtype == torch.uint8:
+        return frames.cpu().contiguous().numpy()
+    return (frames.cpu().float() * 255).round_().clamp_(0, 255).to(torch.uint8).contiguous().numpy()
+
+
+class FrameTensorBuilder:
+    """
+    逐帧构建 [N, H, W, C] 张量的容器，dtype 为 float32（默认）、float16 或 uint8。
+    首帧到达时按 capacity_hint 一次性分配输出张量，之后每一帧都在原地写入并归一化
+    （uint8 只做拷贝，不归一化），峰值内存约等于输出张量本身（外加一帧的 uint8 解码缓冲）。
+    当实际帧数超出预估时按 1.5 倍扩容。
+    """
+    def __init__(self, capacity_hint=0, dtype=None):
+        import torch
+        self.capacity_hint = max(int(capacity_hint), 1)
+        self.dtype = dtype or torch.float32
+        self.tensor = None
+        self.count = 0
+
+    def append(self, frame):
+        """追加一帧 uint8 的 HWC 图像。"""
+        import numpy as np
+        import torch
+        if self.tensor is None:
+            self.tensor = torch.empty((self.capacity_hint, *frame.shape), dtype=self.dtype)
+        elif self.count >= self.tensor.shape[0]:
+            grown = torch.empty((max(self.count + 1, int(self.count * 1.5)), *self.tensor.shape[1:]), dtype=self.dtype)
+            grown[:self.count] = self.tensor[:self.count]
+            self.tensor = grown
+        if self.dtype == torch.uint8:
+            self.tensor[self.count].copy_(torch.from_numpy(np.ascontiguousarray(frame)))
+        else:
+            uint8_to_float_tensor(frame, out=self.tensor[self.count])
+        self.count += 1
+
+    def result(self):
+        """返回已写入的帧；没有任何帧时返回 None。"""
+        if self.tensor is None or self.count == 0:
+            return None
+        if self.count == self.tensor.shape[0]:
+            return self.tensor
+        return self.tensor[:self.count]
+
+
+def frames_nbytes(frames):
+    """帧张量占用的字节数（用于预读取的内存上限）；None 时为 0。"""
+    if frames is None:
+        return 0
+    return frames.numel() * frames.element_size()
+
+
+def fit_max_side(width, height, max_side):
+    """
+    计算将最长边限制为 max_side 后的 (width, height)，保持宽高比。
+    max_side <= 0 或原图已足够小时返回原尺寸。
+    """
+    if max_side <= 0 or max(width, height) <= max_side:
+        return width, height
+    scale = max_side / max(width, height)
+    return max(1, round(width * scale)), max(1, round(height * scale))
@@ -1,14 +1,19 @@
+import io
 import os
-import glob
-import torch
-import numpy as np
-from PIL import Image
+from concurrent.futures import ThreadPoolExecutor
+from .frame_utils import uint8_to_float_tensor, fit_max_side
+from .folder_index import IMAGE_EXTENSIONS, FolderWatcher, ScanOptions, list_file_names
+from .archive_source import ArchiveSource, is_archive_source
+from .iteration_state import IterationState
+from .work_sharding import LeaseManager, next_shard_index
+from .lazy_imports import require
 
 # --------------------------------------------------------------------------------
 # Class: ImageFileIterator
 # 这是一个ComfyUI节点，用于按顺序遍历指定文件夹中的所有图片文件。
 # 它会逐个输出图片数据（作为IMAGE张量）和对应的文件名（不含后缀）。
 # 处理完最后一个文件后，它会抛出一个异常来终止工作流队列。
+# 路径也可以是一个 .tar / .zip 分片，或只包含分片的文件夹：图片直接从分片中解码，无需解压。
 #
 # 改编自 TextFileIterator
 # --------------------------------------------------------------------------------
@@ -18,6 +23,18 @@ class ImageFileIterator:
         self.index = 0
         self.cached_files = []
         self.cached_folder_path = ""
+        self.cached_natural_sort = False
+        self.cached_scan_options = ScanOptions()
+        self.watcher = None
+        self.state = None
+        self.leases = None
+        # 分片数据源（路径为 .tar / .zip 分片时使用）
+        self.archive = None
+        # 预读取（read-ahead）状态：后台线程池，以及 {文件索引: Future} 的映射
+        self._prefetch_executor = None
+        self._prefetch_workers = 0
+        self._prefetch_futures = {}
+        self._prefetch_max_side = 0
 
     @classmethod
     def INPUT_TYPES(cls):
@@ -30,6 +47,56 @@ class ImageFileIterator:
                     "multiline": False,
                     "default": "C:\\path\\to\\your\\image_folder"
                 }),
+            },
+            "optional": {
+                # 预读取深度：在后台提前解码接下来的 N 个批次，0 表示关闭（同步加载）
+                "prefetch_depth": ("INT", {
+                    "default": 0,
+                    "min": 0,
+                    "max": 16,
+                    "step": 1
+                }),
+                # 批次大小：每次执行输出接下来的 N 张图片，解码由线程池并行完成
+                "batch_size": ("INT", {
+                    "default": 1,
+                    "min": 1,
+                    "max": 256,
+                    "step": 1
+                }),
+                # 批次内图片尺寸不一致时的处理策略
+                "size_policy": (["resize", "pad", "crop"], {"default": "resize"}),
+                # 解码时将最长边缩小到该值，0 表示保持原始分辨率（JPEG 直接以低分辨率解码）
+                "max_side": ("INT", {"default": 0, "min": 0, "max": 16384, "step": 8}),
+                # 自然排序：按文件名中的数字大小排序（img2 在 img10 之前）
+                "natural_sort": ("BOOLEAN", {"default": False}),
+                # 递归扫描子文件夹（并发扫描），输出的文件名为相对于文件夹的路径
+                "recursive": ("BOOLEAN", {"default": False}),
+                # 逗号分隔的通配符：只保留 / 排除匹配的文件（含 "/" 的模式匹配相对路径，否则匹配文件名）
+                "include_patterns": ("STRING", {"multiline": False, "default": ""}),
+                "exclude_patterns": ("STRING", {"multiline": False, "default": ""}),
+                # 递归时最多进入几层子文件夹，0 表示不限制
+                "max_depth": ("INT", {"default": 0, "min": 0, "max": 64, "step": 1}),
+                # 监视模式：处理完现有文件后继续等待文件夹中新出现的文件
+                "watch": ("BOOLEAN", {"default": False}),
+                # 监视模式下等待新文件的最长时间（秒），超时后按原逻辑终止
+                "watch_timeout": ("INT", {"default": 300, "min": 1, "max": 86400, "step": 1}),
+                # 断点续传：把迭代位置保存到状态文件，重启后从上次的位置继续
+                "resume": ("BOOLEAN", {"default": False}),
+                # 状态文件目录，留空时保存在被遍历的文件夹内
+                "state_dir": ("STRING", {"multiline": False, "default": ""}),
+                # 重置迭代状态（从第一个文件重新开始）
+                "reset_state": ("BOOLEAN", {"default": False}),
+                # 跳转到指定索引（从 0 开始），-1 表示不跳转
+                "seek_to": ("INT", {"default": -1, "min": -1, "step": 1}),
+                # 多实例分片：none 不分片 / static 按位置静态分片 / dynamic 通过租约文件动态领取
+                "sharding_mode": (["none", "static", "dynamic"], {"default": "none"}),
+                # static 模式：当前实例的分片编号（从 0 开始）与分片总数
+                "shard_index": ("INT", {"default": 0, "min": 0, "max": 1024, "step": 1}),
+                "shard_count": ("INT", {"default": 1, "min": 1, "max": 1024, "step": 1}),
+                # dynamic 模式：租约文件目录（需位于所有实例共享的存储上），留空时使用文件夹内的 .leases 目录
+                "lease_dir": ("STRING", {"multiline": False, "default": ""}),
+                # dynamic 模式：租约有效期（秒），持有者崩溃后超过此时间的文件会被其他实例回收
+                "lease_seconds": ("INT", {"default": 3600, "min": 10, "max": 604800, "step": 10}),
             }
         }
 
@@ -46,64 +113,208 @@ class ImageFileIterator:
         """
         return float("NaN")
         
-    def get_sorted_files(self, folder_path):
+    def get_sorted_files(self, folder_path, natural_sort=False, scan_options=ScanOptions()):
         """
         获取并缓存排序后的图片文件列表。
         """
-        if not os.path.isdir(folder_path):
-            raise NotADirectoryError(f"路径 '{folder_path}' 不是一个有效的文件夹。")
+        if not os.path.isdir(folder_path) and not is_archive_source(folder_path, IMAGE_EXTENSIONS):
+            raise NotADirectoryError(f"路径 '{folder_path}' 不是一个有效的文件夹或 .tar/.zip 分片。")
 
-        if folder_path != self.cached_folder_path:
+        if folder_path != self.cached_folder_path or natural_sort != self.cached_natural_sort \
+                or scan_options != self.cached_scan_options:
             print(f"[ImageFileIterator] 文件夹路径已更改，正在重新扫描: {folder_path}")
-            
-            # --- 修改点 2: 搜索多种图片格式 ---
-            image_extensions = ['.png', '.jpg', '.jpeg', '.webp', '.bmp']
-            files_found = []
-            for ext in image_extensions:
-                # 使用 os.path.join 保证路径正确拼接
-                search_pattern = os.path.join(folder_path, f'*{ext}')
-                files_found.extend(glob.glob(search_pattern))
-            
-            # 获取文件名并排序
-            image_files = [os.path.basename(f) for f in files_found]
-            image_files.sort()
+            if self.archive is not None:
+                self.archive.close()
+                self.archive = None
+
+            if is_archive_source(folder_path, IMAGE_EXTENSIONS):
+                # 分片模式：只建立一次成员索引，迭代的“文件名”是成员在分片中的路径
+                self.archive = ArchiveSource(folder_path, IMAGE_EXTENSIONS, natural_sort)
+                image_files = list(self.archive.keys)
+            else:
+                # --- 修改点 2: 单次扫描匹配多种图片格式（扩展名不区分大小写） ---
+                image_files = list_file_names(folder_path, IMAGE_EXTENSIONS, natural_sort, scan_options)
             
             self.cached_folder_path = folder_path
+            self.cached_natural_sort = natural_sort
+            self.cached_scan_options = scan_options
             self.cached_files = image_files
             
             print(f"[ImageFileIterator] 找到并排序了 {len(image_files)} 个图片文件。")
             self.index = 0
+            self._reset_prefetch()
+            self.watcher = None
             
         return self.cached_files
 
     # --- 修改点 3: 新增图片加载和转换函数 ---
-    def load_image(self, file_path):
+    def load_image(self, file_path, display_name=None, max_side=0):
         """
         使用Pillow加载图片，并将其转换为ComfyUI所需的Tensor格式。
+        file_path 也可以是文件对象（例如分片成员的内容），此时用 display_name 报告错误。
+        max_side > 0 时在转换为float之前把最长边缩小到 max_side：
+        JPEG 通过 draft() 在 DCT 域按 1/2、1/4、1/8 直接低分辨率解码，其余部分再做一次快速缩放。
+        缩小时同时应用 EXIF 方向信息（输出方向与看图软件中一致）；max_side 为 0 时保持原来的行为，按存储的像素方向输出。
         返回的Tensor形状为 [1, height, width, 3] (RGB)
         """
+        # Pillow / numpy 在第一次加载图片时才导入，不影响 ComfyUI 启动速度
+        Image = require("PIL.Image")
+        ImageOps = require("PIL.ImageOps")
+        import numpy as np
         try:
             img = Image.open(file_path)
+            if max_side > 0 and img.format == "JPEG":
+                # draft 只会缩小到不小于请求尺寸的最近比例，必须在读取像素数据之前调用
+                img.draft("RGB", fit_max_side(img.width, img.height, max_side))
+            # 只有带旋转/翻转信息时才转置，避免无谓的整图复制
+            if max_side > 0 and img.getexif().get(0x0112, 1) != 1:
+                img = ImageOps.exif_transpose(img)
             # 转换为RGB格式，以统一处理不同模式的图片（如灰度、RGBA等）
             img = img.convert("RGB")
-            # 将PIL Image对象转换为Numpy数组，并归一化到 [0, 1]
-            img_np = np.array(img).astype(np.float32) / 255.0
-            # 将Numpy数组转换为PyTorch Tensor
-            img_tensor = torch.from_numpy(img_np)
+            if max_side > 0:
+                target_size = fit_max_side(img.width, img.height, max_side)
+                if target_size != img.size:
+                    # reducing_gap 先用整数倍 reduce() 快速缩小，再做双线性插值
+                    img = img.resize(target_size, Image.BILINEAR, reducing_gap=2.0)
+            # 将PIL Image对象转换为uint8 Numpy数组，并在原地归一化到 [0, 1] 的float32 Tensor
+            img_tensor = uint8_to_float_tensor(np.asarray(img))
             # 添加批次维度（batch dimension），ComfyUI期望的格式是 [B, H, W, C]
             img_tensor = img_tensor.unsqueeze(0)
             return img_tensor
         except Exception as e:
-            raise IOError(f"加载或转换图片时发生错误: {os.path.basename(file_path)} - {e}")
+            raise IOError(f"加载或转换图片时发生错误: {display_name or os.path.basename(file_path)} - {e}")
+
+    def load_source_image(self, folder_path, name, max_side=0):
+        """
+        从文件夹或分片中加载一张图片。分片成员直接在内存中解码，不会解压到磁盘。
+        """
+        if self.archive is None:
+            return self.load_image(os.path.join(folder_path, name), max_side=max_side)
+        try:
+            data = self.archive.read_bytes(name)
+        except Exception as e:
+            raise IOError(f"从分片中读取图片时发生错误: {name} - {e}")
+        return self.load_image(io.BytesIO(data), name, max_side)
+
+    def output_name(self, name):
+        """输出的文件名（不含后缀）；分片成员使用其在分片内的路径。"""
+        if self.archive is not None:
+            return self.archive.stems[name]
+        return os.path.splitext(name)[0]
+
+    def _reset_prefetch(self):
+        """
+        丢弃所有预读取结果，尚未开始的后台任务会被取消。
+        """
+        for future in self._prefetch_futures.values():
+            future.cancel()
+        self._prefetch_futures = {}
+
+    def _schedule_prefetch(self, folder_path, image_files, indices, num_workers, max_side=0):
+        """
+        确保 indices 中的图片都已提交到后台线程池解码。
+        已提交的任务不会重复提交，因此内存占用最多为 len(indices) 张图片。
+        """
+        if max_side != self._prefetch_max_side:
+            # 已预读取的结果是按旧的分辨率解码的
+            self._reset_prefetch()
+            self._prefetch_max_side = max_side
+        if self._prefetch_executor is None or self._prefetch_workers != num_workers:
+            self._reset_prefetch()
+            if self._prefetch_executor is not None:
+                self._prefetch_executor.shutdown(wait=False)
+            self._prefetch_executor = ThreadPoolExecutor(max_workers=num_workers, thread_name_prefix="ImageFileIterator")
+            self._prefetch_workers = num_workers
 
-    def iterate_and_load_image(self, folder_path):
+        # 清理已经落后于当前索引的结果（例如索引被重置时）
+        for stale_index in [i for i in self._prefetch_futures if i < self.index]:
+            self._prefetch_futures.pop(stale_index).cancel()
+
+        for i in indices:
+            if i not in self._prefetch_futures:
+                self._prefetch_futures[i] = self._prefetch_executor.submit(self.load_source_image, folder_path, image_files[i], max_side)
+
+    def unify_batch_sizes(self, tensors, size_policy):
+        """
+        将尺寸不一致的图片张量统一为相同的 [H, W]，以便拼接成一个批次。
+        - resize: 缩放到批次中第一张图片的尺寸
+        - pad:    以零值居中填充到批次中最大的宽高
+        - crop:   居中裁剪到批次中最小的宽高
+        """
+        sizes = {(t.shape[1], t.shape[2]) for t in tensors}
+        if len(sizes) == 1:
+            return tensors
+
+        import torch
+
+        if size_policy == "resize":
+            target_h, target_w = tensors[0].shape[1], tensors[0].shape[2]
+            unified = []
+            for t in tensors:
+                if (t.shape[1], t.shape[2]) != (target_h, target_w):
+                    # interpolate 需要 [B, C, H, W] 格式
+                    t = torch.nn.functional.interpolate(t.permute(0, 3, 1, 2), size=(target_h, target_w), mode="bilinear", align_corners=False)
+                    t = t.permute(0, 2, 3, 1).clamp(0.0, 1.0)
+                unified.append(t)
+            return unified
+
+        if size_policy == "pad":
+            target_h = max(h for h, _ in sizes)
+            target_w = max(w for _, w in sizes)
+            unified = []
+            for t in tensors:
+                padded = torch.zeros((1, target_h, target_w, t.shape[3]), dtype=t.dtype)
+                top = (target_h - t.shape[1]) // 2
+                left = (target_w - t.shape[2]) // 2
+                padded[:, top:top + t.shape[1], left:left + t.shape[2], :] = t
+                unified.append(padded)
+            return unified
+
+        if size_policy == "crop":
+            target_h = min(h for h, _ in sizes)
+            target_w = min(w for _, w in sizes)
+            unified = []
+            for t in tensors:
+                top = (t.shape[1] - target_h) // 2
+                left = (t.shape[2] - target_w) // 2
+                unified.append(t[:, top:top + target_h, left:left + target_w, :])
+            return unified
+
+        raise ValueError(f"未知的尺寸处理策略: '{size_policy}'")
+
+    def iterate_and_load_image(self, folder_path, prefetch_depth=0, batch_size=1, size_policy="resize", max_side=0, natural_sort=False,
+                               recursive=False, include_patterns="", exclude_patterns="", max_depth=0,
+                               watch=False, watch_timeout=300, resume=False, state_dir="", reset_state=False, seek_to=-1,
+                               sharding_mode="none", shard_index=0, shard_count=1, lease_dir="", lease_seconds=3600):
         """
         节点的主执行函数。
+        batch_size > 1 时，一次输出接下来的 N 张图片组成的 [N, H, W, C] 批次，
+        文件名以换行符连接后输出。
         """
+        scan_options = ScanOptions(recursive, include_patterns, exclude_patterns, max_depth)
         try:
-            image_files = self.get_sorted_files(folder_path)
+            image_files = self.get_sorted_files(folder_path, natural_sort, scan_options)
         except Exception as e:
             raise e
+
+        # 断点续传：恢复并更新持久化的迭代位置
+        if resume:
+            self.state, self.index = IterationState.sync(self.state, "ImageFileIterator", folder_path, image_files, self.index, state_dir, reset_state, seek_to)
+        else:
+            self.state = None
+
+        # 多实例分片：把上一次输出的文件标记为完成，并定位到下一个属于当前实例的文件
+        leases = None
+        if sharding_mode == "dynamic":
+            self.leases = leases = LeaseManager.for_source(self.leases, folder_path, lease_dir, lease_seconds)
+            leases.commit_in_flight()
+        self.index = next_shard_index(image_files, self.index, sharding_mode, shard_index, shard_count, leases)
+
+        # 监视模式：追加新文件；队列已处理完时阻塞等待（分片是静态数据集，不支持监视）
+        if watch and self.archive is None:
+            self.watcher, image_files = FolderWatcher.append_new_files(self.watcher, "ImageFileIterator", folder_path, IMAGE_EXTENSIONS, self.cached_files, natural_sort,
+                self.index >= len(image_files), watch_timeout, scan_options)
+            self.index = next_shard_index(image_files, self.index, sharding_mode, shard_index, shard_count, leases)
             
         num_files = len(image_files)
 
@@ -113,27 +324,76 @@ class ImageFileIterator:
         # 核心终止逻辑不变
         if self.index >= num_files:
             self.index = 0
+            self._reset_prefetch()
+            if self.state is not None:
+                self.state.finish()
             raise Exception(f"所有 {num_files} 个图片已处理完毕。工作流已终止。若要重新开始，请再次点击'Queue Prompt'。")
 
-        filename = image_files[self.index]
-        full_path = os.path.join(folder_path, filename)
-        
-        print(f"[ImageFileIterator] 正在处理: 图片 {self.index + 1}/{num_files} - {filename}")
+        # 最后一个批次可能不足 batch_size 张
+        if sharding_mode == "none":
+            batch_indices = list(range(self.index, min(self.index + batch_size, num_files)))
+        else:
+            # 分片模式下批次由属于当前实例的文件组成，位置不一定连续
+            batch_indices = [self.index]
+            # 凑批次时不等待其他实例持有的文件，已领取的文件应尽快输出
+            while len(batch_indices) < batch_size:
+                next_index = next_shard_index(image_files, batch_indices[-1] + 1, sharding_mode, shard_index, shard_count, leases, wait=False)
+                if next_index >= num_files:
+                    break
+                batch_indices.append(next_index)
+        batch_files = [image_files[i] for i in batch_indices]
+
+        if len(batch_files) == 1:
+            print(f"[ImageFileIterator] 正在处理: 图片 {self.index + 1}/{num_files} - {batch_files[0]}")
+        else:
+            print(f"[ImageFileIterator] 正在处理: 图片 {batch_indices[0] + 1}-{batch_indices[-1] + 1}/{num_files} ({len(batch_files)} 张)")
         
         try:
             # --- 修改点 4: 调用新的图片加载函数 ---
-            image_tensor = self.load_image(full_path)
+            if prefetch_depth > 0 or batch_size > 1:
+                # 当前批次由线程池并行解码，同时提交后续 prefetch_depth 个批次的解码任务
+                lookahead = batch_size * (prefetch_depth + 1)
+                num_workers = min(lookahead, os.cpu_count() or 1)
+                if sharding_mode == "none":
+                    prefetch_indices = range(self.index, min(self.index + lookahead, num_files))
+                elif sharding_mode == "static":
+                    prefetch_indices = range(self.index, num_files, shard_count)[:lookahead]
+                else:
+                    # dynamic 模式下后续文件可能被其他实例领取，只并行解码当前批次
+                    prefetch_indices = batch_indices
+                self._schedule_prefetch(folder_path, image_files, prefetch_indices, num_workers, max_side)
+                tensors = [self._prefetch_futures.pop(i).result() for i in batch_indices]
+            else:
+                tensors = [self.load_source_image(folder_path, batch_files[0], max_side)]
+
+            if len(tensors) == 1:
+                image_tensor = tensors[0]
+            else:
+                import torch
+                image_tensor = torch.cat(self.unify_batch_sizes(tensors, size_policy), dim=0)
         except Exception as e:
-            self.index += 1
+            # 出错时跳过整个批次，与单张模式下跳过坏文件的行为保持一致
+            for i in batch_indices:
+                future = self._prefetch_futures.pop(i, None)
+                if future is not None:
+                    future.cancel()
+            self.index = batch_indices[-1] + 1
+            if self.state is not None:
+                self.state.deliver(batch_files, self.index)
+            if leases is not None:
+                leases.deliver(batch_files)
             raise e
         
-        self.index += 1
+        self.index = batch_indices[-1] + 1
+        if self.state is not None:
+            self.state.deliver(batch_files, self.index)
+        if leases is not None:
+            leases.deliver(batch_files)
         
-        filename_no_ext = os.path.splitext(filename)[0]
+        filename_no_ext = "\n".join(self.output_name(f) for f in batch_files)
         
         return (image_tensor, filename_no_ext)
 
-
 # --------------------------------------------------------------------------------
 # ComfyUI 节点注册
 # --- 修改点 5: 更新节点映射 ---
@@ -0,0 +1,284 @@
+import os
+import json
+import time
+import hashlib
+
+# --------------------------------------------------------------------------------
+# Class: IterationState
+# 迭代器节点可选的断点续传状态。
+# 把迭代位置（cursor）与已完成文件集合保存到一个小的 JSON 文件中，
+# ComfyUI 重启或崩溃后可以从上次的位置继续，而不是从第 0 个文件重新开始。
+#
+# - 节点输出某个文件后，该文件只处于“进行中”状态；下一次执行节点时
+#   （说明上一次队列已经结束）才把它记为已完成。
+# - 迭代位置保存在一个很小的状态文件中，每次提交都立即原子地写入（先写临时文件再 os.replace），
+#   因此崩溃时只会重新处理进行中的文件。
+# - 已完成文件集合写入旁边的追加日志（<状态文件>.completed，每行一个 JSON 字符串），
+#   按条数/时间批量追加，不会在每次写入时重写整个列表；只有重置或跳转删减集合时才整体重写。
+#   日志滞后于迭代位置不影响续传：迭代位置之前的文件不会被再次访问。
+# - 状态文件默认保存在被遍历的文件夹内的隐藏子文件夹 .iterator_state 中，也可以指定单独的目录。
+#   不直接放在文件夹顶层：每次 os.replace 都会改变所在目录的修改时间，
+#   会让 folder_index 的扫描缓存失效、让监视模式每次都重新扫描整个文件夹。
+#   子文件夹创建之后，在其中写入不会改变被遍历文件夹的修改时间，递归扫描也会跳过它。
+# --------------------------------------------------------------------------------
+# 默认的状态文件子文件夹（位于被遍历的文件夹内）
+STATE_SUBDIR = ".iterator_state"
+
+
+class IterationState:
+    def __init__(self, state_path, folder_path, state_dir="", flush_every=50, flush_interval=10.0):
+        self.state_path = state_path
+        self.folder_path = folder_path
+        self.state_dir = state_dir
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+
+        self.cursor = 0
+        self.completed = set()
+        self.in_flight = []
+        self.pending_cursor = None
+        # 已经应用过的 reset / seek 输入值，持久化以免重启后被重复应用
+        self.applied_reset = False
+        self.applied_seek_to = -1
+
+        # 尚未追加到日志的已完成文件；集合被删减后需要整体重写日志
+        self._unsaved_completed = []
+        self._rewrite_completed = False
+        self._dirty_count = 0
+        self._last_flush = time.time()
+        # 从旧位置迁移来的状态文件，首次写入新位置成功后删除
+        self._legacy_paths = []
+
+    @property
+    def completed_path(self):
+        return f"{self.state_path}.completed"
+
+    @classmethod
+    def state_path_for(cls, node_name, folder_path, state_dir=""):
+        """
+        计算状态文件路径：默认放在文件夹内的 .iterator_state 子文件夹中
+        （数据源是单个文件时放在它旁边的 .iterator_state 中），
+        指定 state_dir 时使用 “节点名_文件夹路径哈希.json”。
+        """
+        if state_dir:
+            folder_hash = hashlib.sha1(os.path.abspath(folder_path).encode('utf-8')).hexdigest()[:16]
+            return os.path.join(state_dir, f"{node_name}_{folder_hash}.json")
+        if os.path.isfile(folder_path):
+            parent, name = os.path.split(folder_path)
+            return os.path.join(parent, STATE_SUBDIR, f"{name}.{node_name}.state.json")
+        return os.path.join(folder_path, STATE_SUBDIR, f"{node_name}.state.json")
+
+    @classmethod
+    def legacy_state_path_for(cls, node_name, folder_path):
+        """旧版本直接保存在文件夹顶层的状态文件路径（只用于迁移）。"""
+        if os.path.isfile(folder_path):
+            parent, name = os.path.split(folder_path)
+            return os.path.join(parent, f".{name}.{node_name}.state.json")
+        return os.path.join(folder_path, f".{node_name}.state.json")
+
+    @classmethod
+    def load(cls, node_name, folder_path, state_dir=""):
+        """
+        读取状态文件；文件不存在或损坏时返回一个空状态。
+        """
+        state = cls(cls.state_path_for(node_name, folder_path, state_dir), folder_path, state_dir)
+        read_path = state.state_path
+        if not state_dir and not os.path.exists(read_path):
+            legacy_path = cls.legacy_state_path_for(node_name, folder_path)
+            if os.path.exists(legacy_path):
+                read_path = legacy_path
+        try:
+            with open(read_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            state.cursor = int(data.get("cursor", 0))
+            state.applied_reset = bool(data.get("applied_reset", False))
+            state.applied_seek_to = int(data.get("applied_seek_to", -1))
+            if "completed" in data:
+                # 旧格式把已完成集合保存在状态文件内，下次写入时迁移到日志
+                state.completed = set(data["completed"])
+                state._rewrite_completed = True
+            state.completed.update(state._read_completed_log(f"{read_path}.completed"))
+            if read_path != state.state_path:
+                # 旧位置的状态文件：下次写入时整体写到新位置
+                state._rewrite_completed = True
+                state._legacy_paths = [read_path, f"{read_path}.completed"]
+            print(f"[IterationState] 从 {read_path} 恢复迭代位置: 第 {state.cursor + 1} 个文件，已完成 {len(state.completed)} 个。")
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            print(f"[IterationState] 状态文件无法读取，将从头开始: {e}")
+        return state
+
+    @classmethod
+    def sync(cls, state, node_name, folder_path, files, index, state_dir="", reset_state=False, seek_to=-1):
+        """
+        节点每次执行时调用：加载（或在文件夹改变时切换）状态文件，返回 (状态, 本次应处理的索引)。
+        """
+        if state is None or not state.matches(folder_path, state_dir):
+            state = cls.load(node_name, folder_path, state_dir)
+            index = state.cursor
+        return state, state.apply(index, files, reset_state, seek_to)
+
+    @staticmethod
+    def _read_completed_log(path):
+        """读取已完成文件日志；崩溃时可能残留不完整的最后一行，直接忽略。"""
+        names = []
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        names.append(json.loads(line))
+                    except ValueError:
+                        continue
+        except FileNotFoundError:
+            pass
+        return names
+
+    def matches(self, folder_path, state_dir):
+        return self.folder_path == folder_path and self.state_dir == state_dir
+
+    def apply(self, index, files, reset_state=False, seek_to=-1):
+        """
+        在节点每次执行开始时调用：
+        1. 把上一次输出的文件记为已完成；
+        2. 应用新的 reset / seek 输入（同一个值只应用一次）；
+        3. 跳过已完成的文件。
+        返回本次应处理的索引。
+        """
+        self.commit_in_flight()
+
+        if reset_state and not self.applied_reset:
+            print("[IterationState] 已重置迭代状态。")
+            self._clear_completed()
+            self.cursor = 0
+            index = 0
+            self._mark_dirty(force=True)
+        if reset_state != self.applied_reset:
+            self.applied_reset = reset_state
+            self._mark_dirty(force=True)
+
+        if seek_to >= 0 and seek_to != self.applied_seek_to:
+            print(f"[IterationState] 迭代位置已跳转到第 {seek_to + 1} 个文件。")
+            self.cursor = seek_to
+            index = seek_to
+            # 跳转后允许重新处理跳转位置之后的文件
+            reopened = self.completed.intersection(files[seek_to:])
+            if reopened:
+                self.completed.difference_update(reopened)
+                self._unsaved_completed = [name for name in self._unsaved_completed if name not in reopened]
+                self._rewrite_completed = True
+        if seek_to != self.applied_seek_to:
+            self.applied_seek_to = seek_to
+            self._mark_dirty(force=True)
+
+        while index < len(files) and files[index] in self.completed:
+            index += 1
+        return index
+
+    def deliver(self, names, next_index):
+        """
+        记录本次输出的文件（进行中）以及之后的迭代位置。
+        """
+        self.in_flight = list(names)
+        self.pending_cursor = next_index
+
+    def commit_in_flight(self):
+        """把进行中的文件记为已完成，并推进持久化的迭代位置。"""
+        if self.pending_cursor is None:
+            return
+        for name in self.in_flight:
+            if name not in self.completed:
+                self.completed.add(name)
+                self._unsaved_completed.append(name)
+        self.cursor = self.pending_cursor
+        self.in_flight = []
+        self.pending_cursor = None
+        self._mark_dirty()
+
+    def finish(self, reset=True):
+        """
+        所有文件处理完毕时调用。reset 为 True 时清空状态，下一次队列从头开始（与节点的内存行为一致）。
+        """
+        self.commit_in_flight()
+        if reset:
+            self.cursor = 0
+            self._clear_completed()
+        self._mark_dirty(force=True)
+
+    def _clear_completed(self):
+        self.completed.clear()
+        self._unsaved_completed = []
+        self._rewrite_completed = True
+
+    def _mark_dirty(self, force=False):
+        """迭代位置每次都立即写入；已完成集合按条数/时间批量追加到日志。"""
+        self._dirty_count += 1
+        if force or self._legacy_paths or self._dirty_count >= self.flush_every or time.time() - self._last_flush >= self.flush_interval:
+            self.flush()
+        else:
+            self._write_state()
+
+    def flush(self):
+        """写入已完成文件日志与状态文件。"""
+        if not self._write_completed():
+            return
+        if not self._write_state():
+            return
+        for path in self._legacy_paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self._legacy_paths = []
+        self._dirty_count = 0
+        self._last_flush = time.time()
+
+    def _write_completed(self):
+        """把新完成的文件追加到日志；集合被删减过时原子地整体重写。返回是否成功。"""
+        if not self._rewrite_completed and not self._unsaved_completed:
+            return True
+        tmp_path = f"{self.completed_path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.state_path) or ".", exist_ok=True)
+            if self._rewrite_completed:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    f.writelines(json.dumps(name, ensure_ascii=False) + "\n" for name in sorted(self.completed))
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.completed_path)
+            else:
+                with open(self.completed_path, 'a', encoding='utf-8') as f:
+                    f.writelines(json.dumps(name, ensure_ascii=False) + "\n" for name in self._unsaved_completed)
+                    f.flush()
+                    os.fsync(f.fileno())
+        except OSError as e:
+            print(f"[IterationState] 写入已完成文件日志失败: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return False
+        self._unsaved_completed = []
+        self._rewrite_completed = False
+        return True
+
+    def _write_state(self):
+        """原子地写入状态文件（只包含迭代位置等少量字段）。返回是否成功。"""
+        data = {
+            "folder_path": os.path.abspath(self.folder_path),
+            "cursor": self.cursor,
+            "applied_reset": self.applied_reset,
+            "applied_seek_to": self.applied_seek_to,
+        }
+        tmp_path = f"{self.state_path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.state_path) or ".", exist_ok=True)
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.state_path)
+        except OSError as e:
+            print(f"[IterationState] 写入状态文件失败: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return False
+        return True
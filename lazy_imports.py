@@ -0,0 +1,45 @@
+import importlib
+import importlib.util
+
+# --------------------------------------------------------------------------------
+# lazy_imports
+# torch / cv2 / av / comfy_api 等重量级依赖只在节点第一次执行时才导入，
+# 注册节点（ComfyUI 启动）时只需要加载轻量的类定义。
+# 注册阶段用 find_spec 检查依赖是否存在（不会真正导入模块），缺失时只禁用受影响的节点。
+# --------------------------------------------------------------------------------
+
+# 依赖缺失时的安装提示
+INSTALL_HINTS = {
+    "torch": "请确认 ComfyUI 的运行环境已正确安装 PyTorch。",
+    "numpy": "pip install numpy",
+    "PIL": "pip install pillow",
+    "cv2": "pip install opencv-python",
+    "av": "pip install av",
+    "comfy_api": "请升级 ComfyUI 到提供 comfy_api 的版本。",
+}
+
+
+def missing_modules(module_names):
+    """返回 module_names 中当前环境无法找到的模块（只检查，不导入）。"""
+    missing = []
+    for name in module_names:
+        try:
+            found = importlib.util.find_spec(name) is not None
+        except (ImportError, ValueError):
+            found = False
+        if not found:
+            missing.append(name)
+    return missing
+
+
+def require(module_name):
+    """
+    导入并返回一个依赖模块；已导入过的模块直接从 sys.modules 返回，开销可以忽略。
+    缺失时抛出带安装提示的 ImportError。
+    """
+    try:
+        return importlib.import_module(module_name)
+    except ImportError as e:
+        top_level = module_name.split(".")[0]
+        hint = INSTALL_HINTS.get(top_level, f"pip install {top_level}")
+        raise ImportError(f"缺少依赖 '{module_name}'，该节点无法运行。安装方法: {hint}") from e
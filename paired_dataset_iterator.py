@@ -0,0 +1,183 @@
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+from .folder_index import IMAGE_EXTENSIONS, TEXT_EXTENSIONS, ScanOptions, list_file_names
+from .archive_source import ArchiveSource, is_archive_source
+from .image_file_iterator import ImageFileIterator
+from .text_file_iterator import TextFileIterator
+
+# --------------------------------------------------------------------------------
+# Class: PairedImageTextIterator
+# 这是一个ComfyUI节点，用于按顺序遍历“图片 + 同名txt提示词”组成的数据集。
+# 扫描时一次性建立 文件名(不含后缀) -> (图片, txt) 的索引，
+# 缺少配对的文件会在开始处理前就被报告（或按设置跳过），
+# 而不是像 图片迭代器 + TXT迭代器 + 文件名比较器 的组合那样在中途才报错终止。
+# 每次执行时，图片解码与txt读取在两个线程中同时进行。
+# image_folder 也可以是 WebDataset 风格的 .tar / .zip 分片（或只包含分片的文件夹），
+# 图片与txt按分片内的同名成员配对，直接从分片中读取，无需解压。
+# 处理完最后一对文件后，它会抛出一个异常来终止工作流队列。
+# --------------------------------------------------------------------------------
+class PairedImageTextIterator:
+    def __init__(self):
+        self.index = 0
+        self.cached_pairs = []
+        self.cached_scan_key = None
+        self.archive = None
+        # 复用现有节点的图片加载与多编码文本读取逻辑
+        self.image_loader = ImageFileIterator()
+        self.text_reader = TextFileIterator()
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="PairedImageTextIterator")
+
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "image_folder": ("STRING", {
+                    "multiline": False,
+                    "default": "C:\\path\\to\\your\\image_folder"
+                }),
+                # 缺少配对文件时的处理方式：skip 跳过 / error 在开始前报错
+                "on_unmatched": (["skip", "error"], {"default": "skip"}),
+            },
+            "optional": {
+                # txt文件所在文件夹，留空表示与图片在同一文件夹（分片模式下忽略）
+                "text_folder": ("STRING", {
+                    "multiline": False,
+                    "default": ""
+                }),
+                # 自然排序：按文件名中的数字大小排序（img2 在 img10 之前）
+                "natural_sort": ("BOOLEAN", {"default": False}),
+                # 递归扫描子文件夹（并发扫描），输出的文件名为相对于文件夹的路径
+                "recursive": ("BOOLEAN", {"default": False}),
+                # 逗号分隔的通配符：只保留 / 排除匹配的文件（含 "/" 的模式匹配相对路径，否则匹配文件名）
+                "include_patterns": ("STRING", {"multiline": False, "default": ""}),
+                "exclude_patterns": ("STRING", {"multiline": False, "default": ""}),
+                # 递归时最多进入几层子文件夹，0 表示不限制
+                "max_depth": ("INT", {"default": 0, "min": 0, "max": 64, "step": 1}),
+            }
+        }
+
+    RETURN_TYPES = ("IMAGE", "STRING", "STRING")
+    RETURN_NAMES = ("image", "prompt", "文件名")
+    FUNCTION = "iterate_pairs"
+    CATEGORY = "utilities/loaders"
+
+    @classmethod
+    def IS_CHANGED(cls, *args, **kwargs):
+        """
+        强制节点重新运行以实现迭代。
+        """
+        return float("NaN")
+
+    def build_pair_index(self, image_folder, text_folder, on_unmatched, natural_sort=False, scan_options=ScanOptions()):
+        """
+        扫描两个文件夹并按文件名（不含后缀）做哈希连接，返回 [(stem, 图片文件名, txt文件名)]。
+        分片模式下连接的是同一分片内的成员，文件名为成员在分片内的路径。
+        递归模式下按相对路径（不含后缀）配对；include_patterns 只用于筛选图片。
+        只有文件夹或参数改变时才重新扫描。
+        """
+        scan_key = (image_folder, text_folder, on_unmatched, natural_sort, scan_options)
+        if scan_key == self.cached_scan_key:
+            return self.cached_pairs
+
+        print(f"[PairedImageTextIterator] 文件夹路径已更改，正在重新扫描: {image_folder} / {text_folder}")
+        if self.archive is not None:
+            self.archive.close()
+            self.archive = None
+        if is_archive_source(image_folder, IMAGE_EXTENSIONS):
+            # 一次索引同时包含图片与txt成员，按成员后缀拆分
+            self.archive = ArchiveSource(image_folder, IMAGE_EXTENSIONS | TEXT_EXTENSIONS, natural_sort)
+            image_files = [key for key in self.archive.keys if os.path.splitext(key)[1].lower() in IMAGE_EXTENSIONS]
+            text_files = [key for key in self.archive.keys if os.path.splitext(key)[1].lower() in TEXT_EXTENSIONS]
+        else:
+            image_files = list_file_names(image_folder, IMAGE_EXTENSIONS, natural_sort, scan_options)
+            text_files = list_file_names(text_folder, TEXT_EXTENSIONS, natural_sort, scan_options._replace(include=""))
+
+        images_by_stem = {}
+        duplicates = []
+        for name in image_files:
+            stem = os.path.splitext(name)[0]
+            if stem in images_by_stem:
+                duplicates.append(name)
+                continue
+            images_by_stem[stem] = name
+        texts_by_stem = {os.path.splitext(name)[0]: name for name in text_files}
+
+        # 保持图片文件的排序顺序；分片模式下输出的文件名不带分片名前缀
+        pairs = [(self.archive.stems[image_name] if self.archive is not None else stem, image_name, texts_by_stem[stem])
+                 for stem, image_name in images_by_stem.items() if stem in texts_by_stem]
+        images_without_text = [name for stem, name in images_by_stem.items() if stem not in texts_by_stem]
+        texts_without_image = [name for stem, name in texts_by_stem.items() if stem not in images_by_stem]
+
+        if duplicates:
+            print(f"[PairedImageTextIterator] 警告: {len(duplicates)} 个图片与其他图片同名（仅后缀不同），已忽略: {duplicates[:10]}")
+        if images_without_text or texts_without_image:
+            message = (f"{len(images_without_text)} 个图片没有对应的txt文件: {images_without_text[:10]}；"
+                       f"{len(texts_without_image)} 个txt文件没有对应的图片: {texts_without_image[:10]}")
+            if on_unmatched == "error":
+                raise FileNotFoundError(f"存在未配对的文件，工作流已终止。{message}")
+            print(f"[PairedImageTextIterator] 已跳过未配对的文件。{message}")
+
+        self.cached_scan_key = scan_key
+        self.cached_pairs = pairs
+        print(f"[PairedImageTextIterator] 找到并排序了 {len(pairs)} 对图片与txt文件。")
+        self.index = 0
+        return self.cached_pairs
+
+    def read_archive_image(self, name):
+        """直接在内存中解码分片中的一个图片成员。"""
+        return self.image_loader.load_image(io.BytesIO(self.archive.read_bytes(name)), name)
+
+    def read_archive_text(self, name):
+        """从分片中读取一个txt成员并按多种编码解码。"""
+        return self.text_reader.decode_with_multiple_encodings(self.archive.read_bytes(name))
+
+    def iterate_pairs(self, image_folder, on_unmatched, text_folder="", natural_sort=False,
+                      recursive=False, include_patterns="", exclude_patterns="", max_depth=0):
+        """
+        节点的主执行函数。
+        """
+        text_folder = text_folder or image_folder
+        scan_options = ScanOptions(recursive, include_patterns, exclude_patterns, max_depth)
+        pairs = self.build_pair_index(image_folder, text_folder, on_unmatched, natural_sort, scan_options)
+        num_pairs = len(pairs)
+
+        if num_pairs == 0:
+            raise FileNotFoundError(f"在文件夹 '{image_folder}' 与 '{text_folder}' 中没有找到任何同名的图片与txt文件。")
+
+        if self.index >= num_pairs:
+            self.index = 0
+            raise Exception(f"所有 {num_pairs} 对文件已处理完毕。工作流已终止。若要重新开始，请再次点击'Queue Prompt'。")
+
+        stem, image_name, text_name = pairs[self.index]
+        print(f"[PairedImageTextIterator] 正在处理: 第 {self.index + 1}/{num_pairs} 对 - {stem}")
+
+        try:
+            # 图片解码与txt读取同时进行
+            if self.archive is not None:
+                image_future = self._executor.submit(self.read_archive_image, image_name)
+                text_future = self._executor.submit(self.read_archive_text, text_name)
+            else:
+                image_future = self._executor.submit(self.image_loader.load_image, os.path.join(image_folder, image_name))
+                text_future = self._executor.submit(self.text_reader.read_file_with_multiple_encodings, os.path.join(text_folder, text_name))
+            image_tensor = image_future.result()
+            content = text_future.result()
+        except Exception as e:
+            self.index += 1
+            raise e
+
+        self.index += 1
+
+        return (image_tensor, content, stem)
+
+
+# --------------------------------------------------------------------------------
+# ComfyUI 节点注册
+# --------------------------------------------------------------------------------
+NODE_CLASS_MAPPINGS = {
+    "PairedImageTextIterator": PairedImageTextIterator
+}
+
+NODE_DISPLAY_NAME_MAPPINGS = {
+    "PairedImageTextIterator": "逐对读取图片与TXT文件 (Iterator)"
+}
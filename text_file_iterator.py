@@ -1,5 +1,9 @@
 import os
-import glob
+import codecs
+import threading
+from .folder_index import TEXT_EXTENSIONS, FolderWatcher, ScanOptions, list_file_names
+from .iteration_state import IterationState
+from .text_manifest import TextManifest
 
 # --------------------------------------------------------------------------------
 # Class: TextFileIterator
@@ -11,11 +15,27 @@ import glob
 # V4: 修改 - “文件名”输出端口不包含文件后缀。
 # --------------------------------------------------------------------------------
 class TextFileIterator:
+    # 依次尝试的编码格式
+    # 顺序固定：utf-8 对不合法的字节会报错，必须最先尝试；gbk / cp1252 / latin-1 能解码大多数字节，
+    # 提前尝试会把 UTF-8 文本静默解码成乱码，因此不按文件夹记忆并调整顺序
+    ENCODINGS_TO_TRY = ['utf-8', 'gbk', 'utf-8-sig', 'cp1252', 'latin-1']
+
     def __init__(self):
         # 初始化实例变量
         self.index = 0
         self.cached_files = []
         self.cached_folder_path = ""
+        self.cached_natural_sort = False
+        self.cached_scan_options = ScanOptions()
+        self.watcher = None
+        self.state = None
+        # 清单模式（folder_path 指向单个文件）下的偏移量索引
+        self.manifest = None
+        # 后台预加载的文件内容 {完整路径: 原始字节}
+        self._preloaded = {}
+        self._preload_consumed = set()
+        self._preload_folder = None
+        self._preload_generation = 0
 
     @classmethod
     def INPUT_TYPES(cls):
@@ -28,6 +48,35 @@ class TextFileIterator:
                     "multiline": False,
                     "default": "C:\\path\\to\\your\\folder_A"
                 }),
+            },
+            "optional": {
+                # 自然排序：按文件名中的数字大小排序（2.txt 在 10.txt 之前）
+                "natural_sort": ("BOOLEAN", {"default": False}),
+                # 递归扫描子文件夹（并发扫描），输出的文件名为相对于文件夹的路径
+                "recursive": ("BOOLEAN", {"default": False}),
+                # 逗号分隔的通配符：只保留 / 排除匹配的文件（含 "/" 的模式匹配相对路径，否则匹配文件名）
+                "include_patterns": ("STRING", {"multiline": False, "default": ""}),
+                "exclude_patterns": ("STRING", {"multiline": False, "default": ""}),
+                # 递归时最多进入几层子文件夹，0 表示不限制
+                "max_depth": ("INT", {"default": 0, "min": 0, "max": 64, "step": 1}),
+                # 监视模式：处理完现有文件后继续等待文件夹中新出现的文件
+                "watch": ("BOOLEAN", {"default": False}),
+                # 监视模式下等待新文件的最长时间（秒），超时后按原逻辑终止
+                "watch_timeout": ("INT", {"default": 300, "min": 1, "max": 86400, "step": 1}),
+                # 断点续传：把迭代位置保存到状态文件，重启后从上次的位置继续
+                "resume": ("BOOLEAN", {"default": False}),
+                # 状态文件目录，留空时保存在被遍历的文件夹内
+                "state_dir": ("STRING", {"multiline": False, "default": ""}),
+                # 重置迭代状态（从第一个文件重新开始）
+                "reset_state": ("BOOLEAN", {"default": False}),
+                # 跳转到指定索引（从 0 开始），-1 表示不跳转
+                "seek_to": ("INT", {"default": -1, "min": -1, "step": 1}),
+                # 清单模式（folder_path 为 JSONL/CSV/TSV 文件）下prompt所在的字段名
+                "manifest_text_field": ("STRING", {"multiline": False, "default": "prompt"}),
+                # 清单模式下作为“文件名”输出的字段名，缺失时输出记录编号
+                "manifest_name_field": ("STRING", {"multiline": False, "default": "name"}),
+                # 在后台一次性把整个文件夹的txt内容预加载到内存
+                "preload_folder": ("BOOLEAN", {"default": False}),
             }
         }
 
@@ -43,7 +92,7 @@ class TextFileIterator:
         """
         return float("NaN")
         
-    def get_sorted_files(self, folder_path):
+    def get_sorted_files(self, folder_path, natural_sort=False, scan_options=ScanOptions()):
         """
         获取并缓存排序后的文件列表，以提高效率。只有当文件夹路径改变时，才重新扫描文件系统。
         """
@@ -52,58 +101,171 @@ class TextFileIterator:
             raise NotADirectoryError(f"路径 '{folder_path}' 不是一个有效的文件夹。")
 
         # 仅当路径改变时才重新扫描文件系统
-        if folder_path != self.cached_folder_path:
+        if folder_path != self.cached_folder_path or natural_sort != self.cached_natural_sort \
+                or scan_options != self.cached_scan_options:
             print(f"[TextFileIterator] 文件夹路径已更改，正在重新扫描: {folder_path}")
-            search_path = os.path.join(folder_path, '*.txt')
-            files = glob.glob(search_path)
-            txt_files = [os.path.basename(f) for f in files]
-            txt_files.sort()
+            txt_files = list_file_names(folder_path, TEXT_EXTENSIONS, natural_sort, scan_options)
             
             # 更新缓存
             self.cached_folder_path = folder_path
+            self.cached_natural_sort = natural_sort
+            self.cached_scan_options = scan_options
             self.cached_files = txt_files
             
             print(f"[TextFileIterator] 找到并排序了 {len(txt_files)} 个 .txt 文件。")
             # 当文件夹改变时，重置迭代器索引，从头开始
             self.index = 0
+            self.watcher = None
             
         return self.cached_files
 
     def read_file_with_multiple_encodings(self, file_path):
         """
         尝试使用多种编码格式读取文件内容。
+        文件字节只读取一次（或直接取自后台预加载的结果），随后在内存中依次尝试各个编码。
         """
-        encodings_to_try = ['utf-8', 'gbk', 'utf-8-sig', 'cp1252', 'latin-1']
-        
-        for encoding in encodings_to_try:
+        try:
+            data = self._preloaded.pop(file_path, None)
+            if data is None:
+                if self._preload_folder is not None:
+                    self._preload_consumed.add(file_path)
+                with open(file_path, 'rb') as f:
+                    data = f.read()
+        except Exception as e:
+            raise IOError(f"读取文件时发生意外错误: {e}")
+
+        try:
+            return self.decode_with_multiple_encodings(data)
+        except ValueError:
+            raise ValueError(f"无法使用任何支持的编码格式解码文件 '{os.path.basename(file_path)}'。")
+
+    def decode_with_multiple_encodings(self, data):
+        """
+        按 ENCODINGS_TO_TRY 的顺序在内存中解码已读取的字节（文件只读取一次）。
+        带 BOM 的文本直接按 BOM 解码；只有回退到 utf-8 以外的编码时才打印日志。
+        """
+        if data.startswith(codecs.BOM_UTF8):
             try:
-                with open(file_path, 'r', encoding=encoding) as f:
-                    content = f.read()
-                print(f"[TextFileIterator] 成功使用 '{encoding}' 编码读取文件。")
-                return content
+                return data[len(codecs.BOM_UTF8):].decode('utf-8')
+            except UnicodeDecodeError:
+                pass
+        elif data.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+            try:
+                return data.decode('utf-16')
+            except UnicodeDecodeError:
+                pass
+
+        for encoding in self.ENCODINGS_TO_TRY:
+            try:
+                content = data.decode(encoding)
             except (UnicodeDecodeError, UnicodeError):
                 continue
-            except Exception as e:
-                raise IOError(f"读取文件时发生意外错误: {e}")
-        
-        raise UnicodeDecodeError(f"无法使用任何支持的编码格式解码文件 '{os.path.basename(file_path)}'。")
+            if encoding != 'utf-8':
+                print(f"[TextFileIterator] 成功使用 '{encoding}' 编码读取文件。")
+            return content
+        raise ValueError("无法使用任何支持的编码格式解码文本。")
+
+    def start_preload(self, folder_path, txt_files):
+        """
+        在后台线程中一次性读取整个文件夹的txt文件（原始字节），后续执行直接从内存中取用。
+        """
+        if self._preload_folder == folder_path:
+            return
+        self.stop_preload()
+        self._preload_folder = folder_path
+        generation = self._preload_generation
+        paths = [os.path.join(folder_path, name) for name in txt_files[self.index:]]
+
+        def preload_worker():
+            for path in paths:
+                if self._preload_generation != generation:
+                    return
+                if path in self._preload_consumed:
+                    continue
+                try:
+                    with open(path, 'rb') as f:
+                        data = f.read()
+                except OSError:
+                    continue
+                if self._preload_generation == generation and path not in self._preload_consumed:
+                    self._preloaded[path] = data
+            print(f"[TextFileIterator] 已在后台预加载 {len(paths)} 个文件。")
+
+        print(f"[TextFileIterator] 开始在后台预加载文件夹内容: {folder_path}")
+        threading.Thread(target=preload_worker, name="TextFileIteratorPreload", daemon=True).start()
+
+    def stop_preload(self):
+        """停止后台预加载并释放已预加载的内容。"""
+        self._preload_generation += 1
+        self._preload_folder = None
+        self._preloaded = {}
+        self._preload_consumed = set()
 
-    def iterate_and_read(self, folder_path):
+    def get_manifest(self, manifest_path, text_field, name_field):
+        """
+        获取并缓存清单文件的偏移量索引。只有路径、字段名或文件内容改变时才重新建立索引。
+        """
+        manifest = self.manifest
+        if (manifest is None or manifest.path != manifest_path or manifest.text_field != text_field
+                or manifest.name_field != name_field or manifest.is_stale()):
+            if manifest is not None:
+                manifest.close()
+            print(f"[TextFileIterator] 正在为清单文件建立索引: {manifest_path}")
+            self.manifest = TextManifest(manifest_path, self.decode_with_multiple_encodings, text_field, name_field)
+            # 与文件夹模式一致：数据源改变时从头开始
+            if manifest_path != self.cached_folder_path:
+                self.cached_folder_path = manifest_path
+                self.cached_files = []
+                self.index = 0
+                self.watcher = None
+        return self.manifest
+
+    def iterate_and_read(self, folder_path, natural_sort=False, recursive=False, include_patterns="", exclude_patterns="", max_depth=0, watch=False, watch_timeout=300,
+                         resume=False, state_dir="", reset_state=False, seek_to=-1,
+                         manifest_text_field="prompt", manifest_name_field="name", preload_folder=False):
         """
         节点的主执行函数。
         如果所有文件都已处理，则抛出异常终止工作流。
+        folder_path 指向单个 JSONL/CSV/TSV/TXT 文件时，按记录逐条输出（清单模式）。
         """
-        # 获取文件列表，此函数会处理路径变更和索引重置
-        try:
-            txt_files = self.get_sorted_files(folder_path)
-        except Exception as e:
-            # 将 get_sorted_files 中的错误传递给ComfyUI
-            raise e
+        scan_options = ScanOptions(recursive, include_patterns, exclude_patterns, max_depth)
+        manifest = None
+        if os.path.isfile(folder_path):
+            # 清单模式：记录编号代替文件列表参与迭代
+            manifest = self.get_manifest(folder_path, manifest_text_field, manifest_name_field)
+            txt_files = manifest.keys
+        else:
+            self.manifest = None
+            # 获取文件列表，此函数会处理路径变更和索引重置
+            try:
+                txt_files = self.get_sorted_files(folder_path, natural_sort, scan_options)
+            except Exception as e:
+                # 将 get_sorted_files 中的错误传递给ComfyUI
+                raise e
+
+        # 断点续传：恢复并更新持久化的迭代位置
+        if resume:
+            self.state, self.index = IterationState.sync(self.state, "TextFileIterator", folder_path, txt_files, self.index, state_dir, reset_state, seek_to)
+        else:
+            self.state = None
+
+        # 监视模式：追加新文件；队列已处理完时阻塞等待
+        if watch and manifest is None:
+            self.watcher, txt_files = FolderWatcher.append_new_files(self.watcher, "TextFileIterator", folder_path, TEXT_EXTENSIONS, self.cached_files, natural_sort,
+                self.index >= len(txt_files), watch_timeout, scan_options)
+
+        # 后台预加载整个文件夹的内容
+        if preload_folder and manifest is None:
+            self.start_preload(folder_path, txt_files)
+        elif self._preload_folder is not None:
+            self.stop_preload()
             
         num_files = len(txt_files)
 
         # 如果文件夹为空，直接终止
         if num_files == 0:
+            if manifest is not None:
+                raise FileNotFoundError(f"清单文件 '{folder_path}' 中没有任何记录。")
             raise FileNotFoundError(f"在文件夹 '{folder_path}' 中没有找到任何 .txt 文件。")
 
         # **核心终止逻辑**
@@ -111,6 +273,8 @@ class TextFileIterator:
         if self.index >= num_files:
             # 将索引重置为0，以便下次队列可以从头开始
             self.index = 0
+            if self.state is not None:
+                self.state.finish()
             # 抛出异常，终止工作流
             raise Exception(f"所有 {num_files} 个文件已处理完毕。工作流已终止。若要重新开始，请再次点击'Queue Prompt'。")
 
@@ -121,18 +285,24 @@ class TextFileIterator:
         print(f"[TextFileIterator] 正在处理: 文件 {self.index + 1}/{num_files} - {filename}")
         
         try:
-            content = self.read_file_with_multiple_encodings(full_path)
+            if manifest is not None:
+                filename_no_ext, content = manifest.record(self.index)
+            else:
+                content = self.read_file_with_multiple_encodings(full_path)
+                # --- 修改点 ---
+                # 使用 os.path.splitext 来移除文件名中的后缀
+                filename_no_ext = os.path.splitext(filename)[0]
         except Exception as e:
             # 如果读取特定文件时出错，也抛出异常终止
             self.index += 1 # 增加索引，以便下次跳过这个坏文件
+            if self.state is not None:
+                self.state.deliver([filename], self.index)
             raise e
         
         # 为下一次执行准备，将索引加一
         self.index += 1
-        
-        # --- 修改点 ---
-        # 使用 os.path.splitext 来移除文件名中的后缀
-        filename_no_ext = os.path.splitext(filename)[0]
+        if self.state is not None:
+            self.state.deliver([filename], self.index)
         
         return (content, filename_no_ext)
 
@@ -0,0 +1,123 @@
+import os
+import csv
+import json
+
+# --------------------------------------------------------------------------------
+# Class: TextManifest
+# TextFileIterator 的单文件数据源：JSONL / CSV / TSV 清单，或每行一个prompt的纯文本文件。
+# 首次加载时只扫描一遍文件，记录每条记录的字节偏移量；
+# 之后按游标读取某条记录只需一次 seek + read，无需再为每个prompt打开一个小文件。
+# --------------------------------------------------------------------------------
+
+class TextManifest:
+    def __init__(self, path, decode_fn, text_field="prompt", name_field="name"):
+        self.path = path
+        self.decode_fn = decode_fn
+        self.text_field = text_field
+        self.name_field = name_field
+        self.format = self._detect_format(path)
+        self.header = None
+        self.offsets = []
+        stat = os.stat(path)
+        self.signature = (stat.st_size, stat.st_mtime_ns)
+        self._file = None
+        self._build_index()
+        # 记录编号（从 1 开始、补零），作为迭代状态的键以及没有 name 字段时输出的文件名
+        width = max(6, len(str(len(self))))
+        self.keys = [str(i + 1).zfill(width) for i in range(len(self))]
+
+    @staticmethod
+    def _detect_format(path):
+        ext = os.path.splitext(path)[1].lower()
+        if ext == '.jsonl':
+            return 'jsonl'
+        if ext == '.csv':
+            return 'csv'
+        if ext == '.tsv':
+            return 'tsv'
+        return 'lines'
+
+    def is_stale(self):
+        """清单文件自建立索引后被修改过时返回 True。"""
+        stat = os.stat(self.path)
+        return (stat.st_size, stat.st_mtime_ns) != self.signature
+
+    def _build_index(self):
+        """
+        扫描一遍文件，记录每条非空记录的 (起始偏移, 长度)。
+        CSV/TSV 中带引号的字段可以跨行，按引号奇偶性判断一条记录是否结束。
+        """
+        quoted = self.format in ('csv', 'tsv')
+        offsets = []
+        with open(self.path, 'rb') as f:
+            record_start = None
+            quote_count = 0
+            position = 0
+            for line in f:
+                if record_start is None:
+                    if not line.strip():
+                        position += len(line)
+                        continue
+                    record_start = position
+                    quote_count = 0
+                position += len(line)
+                if quoted:
+                    quote_count += line.count(b'"')
+                    if quote_count % 2 == 1:
+                        continue
+                offsets.append((record_start, position - record_start))
+                record_start = None
+            if record_start is not None:
+                offsets.append((record_start, position - record_start))
+
+        if quoted and offsets:
+            # 第一条记录是表头
+            header_offset, header_length = offsets.pop(0)
+            self.header = self._parse_csv_row(self._read_raw(header_offset, header_length))
+        self.offsets = offsets
+        print(f"[TextManifest] 已建立索引: {os.path.basename(self.path)} 共 {len(offsets)} 条记录。")
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def _read_raw(self, offset, length):
+        if self._file is None:
+            self._file = open(self.path, 'rb')
+        self._file.seek(offset)
+        data = self._file.read(length)
+        if offset == 0 and data.startswith(b'\xef\xbb\xbf'):
+            data = data[3:]
+        return self.decode_fn(data)
+
+    def _parse_csv_row(self, text):
+        delimiter = '\t' if self.format == 'tsv' else ','
+        return next(csv.reader([text], delimiter=delimiter), [])
+
+    def record(self, index):
+        """
+        返回第 index 条记录的 (文件名, prompt)。没有 name 字段时文件名为记录编号。
+        """
+        offset, length = self.offsets[index]
+        text = self._read_raw(offset, length)
+        name = self.keys[index]
+
+        if self.format == 'lines':
+            return name, text.rstrip('\r\n')
+
+        if self.format == 'jsonl':
+            record = json.loads(text)
+            if isinstance(record, str):
+                return name, record
+        else:
+            record = dict(zip(self.header, self._parse_csv_row(text)))
+
+        if self.text_field not in record:
+            raise KeyError(f"第 {index + 1} 条记录中没有字段 '{self.text_field}'。")
+        if record.get(self.name_field):
+            name = str(record[self.name_field])
+        return name, str(record[self.text_field])
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -0,0 +1,210 @@
+import os
+from .lazy_imports import require
+
+# --------------------------------------------------------------------------------
+# video_backend
+# 三个视频节点共用的解码层。open_video() 按 backend 返回 OpenCV 或 PyAV 实现的读取器，
+# 两者提供相同的接口：
+# - fps / frame_count / width / height: 容器元数据（frame_count 不可靠时可能为估算值或 0）
+# - iter_frames(): 按 起始帧 / 步长 / 最大帧数 顺序产出 (帧序号, uint8 HWC 数组)，
+#   不需要的帧只解码不做缩放与颜色转换
+# - read_at(): 跳转到指定帧并读取一帧
+# decode_threads 控制解码线程数（0 表示由后端自动选择）：
+# PyAV 使用 thread_type = "AUTO"（同时启用帧级与切片级多线程），
+# OpenCV 通过 CAP_PROP_N_THREADS 传给 FFmpeg 后端（需要 OpenCV 4.6 及以上）。
+# --------------------------------------------------------------------------------
+
+DECODE_BACKENDS = ["opencv", "pyav"]
+
+
+def open_video(file_path, backend="opencv", decode_threads=0):
+    """打开视频并返回对应后端的读取器（支持 with 语句）。"""
+    if backend == "opencv":
+        return OpenCVVideoReader(file_path, decode_threads)
+    if backend == "pyav":
+        return PyAVVideoReader(file_path, decode_threads)
+    raise ValueError(f"未知的解码后端: '{backend}'")
+
+
+class VideoReader:
+    """解码读取器的公共接口。"""
+    fps = 0.0
+    frame_count = 0
+    width = 0
+    height = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def iter_frames(self, start_frame=0, frame_stride=1, max_frames=0, size=None, color="rgb"):
+        """
+        从 start_frame 开始每隔 frame_stride 帧产出一帧，最多 max_frames 帧（0 表示不限制）。
+        size 为 (width, height) 时在颜色转换之前缩放；color 为 "rgb" 或 "bgr"。
+        为避免逐帧分配内存，产出的数组可能在下一帧被复用，调用方需要在继续迭代前拷贝。
+        """
+        raise NotImplementedError
+
+    def read_at(self, frame_idx, size=None, color="rgb"):
+        """跳转到第 frame_idx 帧并读取；读取失败时返回 None。"""
+        raise NotImplementedError
+
+    def close(self):
+        raise NotImplementedError
+
+
+class OpenCVVideoReader(VideoReader):
+    def __init__(self, file_path, decode_threads=0):
+        self.cv2 = require("cv2")
+        cv2 = self.cv2
+        self.cap = None
+        n_threads_prop = getattr(cv2, "CAP_PROP_N_THREADS", None)
+        if decode_threads > 0 and n_threads_prop is not None:
+            self.cap = cv2.VideoCapture(file_path, cv2.CAP_FFMPEG, [n_threads_prop, decode_threads])
+        if self.cap is None or not self.cap.isOpened():
+            self.cap = cv2.VideoCapture(file_path)
+        if not self.cap.isOpened():
+            raise IOError(f"无法打开视频文件: {os.path.basename(file_path)}")
+
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS)
+        self.frame_count = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+
+    def _convert(self, frame, size, color, resized=None, converted=None):
+        """缩放（INTER_AREA）并转换颜色；resized / converted 为可复用的输出缓冲区。"""
+        cv2 = self.cv2
+        source = frame
+        if size is not None and size != (frame.shape[1], frame.shape[0]):
+            resized = cv2.resize(frame, size, dst=resized, interpolation=cv2.INTER_AREA)
+            source = resized
+        if color == "rgb":
+            # OpenCV默认读取为BGR格式，需要转换为RGB
+            converted = cv2.cvtColor(source, cv2.COLOR_BGR2RGB, dst=converted)
+            source = converted
+        return source, resized, converted
+
+    def iter_frames(self, start_frame=0, frame_stride=1, max_frames=0, size=None, color="rgb"):
+        if start_frame > 0:
+            self.cap.set(self.cv2.CAP_PROP_POS_FRAMES, start_frame)
+
+        # 解码与颜色转换复用同一组uint8缓冲区
+        frame = None
+        resized = None
+        converted = None
+        frame_idx = start_frame
+        kept = 0
+        while max_frames <= 0 or kept < max_frames:
+            # 不需要的帧只grab不retrieve，跳过解码后的颜色转换
+            if (frame_idx - start_frame) % frame_stride != 0:
+                if not self.cap.grab():
+                    return
+                frame_idx += 1
+                continue
+
+            ret, frame = self.cap.read(frame)
+            if not ret:
+                return  # 视频读取完毕或发生错误
+            output, resized, converted = self._convert(frame, size, color, resized, converted)
+            yield frame_idx, output
+            kept += 1
+            frame_idx += 1
+
+    def read_at(self, frame_idx, size=None, color="rgb"):
+        self.cap.set(self.cv2.CAP_PROP_POS_FRAMES, frame_idx)
+        ret, frame = self.cap.read()
+        if not ret:
+            return None
+        return self._convert(frame, size, color)[0]
+
+    def close(self):
+        if self.cap is not None and self.cap.isOpened():
+            self.cap.release()
+
+
+class PyAVVideoReader(VideoReader):
+    def __init__(self, file_path, decode_threads=0):
+        self.av = require("av")
+        try:
+            self.container = self.av.open(file_path)
+        except Exception as e:
+            raise IOError(f"无法打开视频文件: {os.path.basename(file_path)} - {e}") from e
+        self.stream = self.container.streams.video[0]
+        # 帧级 + 切片级多线程解码，必须在开始解码之前设置
+        self.stream.codec_context.thread_type = "AUTO"
+        self.stream.codec_context.thread_count = decode_threads
+
+        self.fps = float(self.stream.average_rate or 0)
+        self.frame_count = self.stream.frames
+        if self.frame_count <= 0 and self.stream.duration is not None and self.stream.time_base is not None:
+            # 部分容器不记录帧数，按时长估算
+            self.frame_count = int(round(float(self.stream.duration * self.stream.time_base) * self.fps))
+        self.width = self.stream.codec_context.width
+        self.height = self.stream.codec_context.height
+        # 第一帧的时间戳（秒）。MP4 编辑列表、MPEG-TS 等容器中通常不为 0，跳转目标与帧时间都要以它为起点
+        self.start_time = 0.0
+        if self.stream.start_time is not None and self.stream.time_base is not None:
+            self.start_time = float(self.stream.start_time * self.stream.time_base)
+
+    def _to_ndarray(self, frame, size, color):
+        # 缩放由 reformat 在颜色转换时一并完成，不会产生全分辨率的中间数组
+        width, height = size if size is not None else (frame.width, frame.height)
+        return frame.reformat(width=width, height=height, format="rgb24" if color == "rgb" else "bgr24").to_ndarray()
+
+    def iter_frames(self, start_frame=0, frame_stride=1, max_frames=0, size=None, color="rgb"):
+        kept = 0
+        for frame_idx, frame in enumerate(self.container.decode(self.stream)):
+            # 不需要的帧跳过颜色转换
+            if frame_idx < start_frame or (frame_idx - start_frame) % frame_stride != 0:
+                continue
+            yield frame_idx, self._to_ndarray(frame, size, color)
+            kept += 1
+            if max_frames > 0 and kept >= max_frames:
+                return
+
+    def _seek_time(self, target_time):
+        """跳转到目标时刻（相对第一帧）之前最近的关键帧，再向后解码到目标时刻；返回该帧或 None。"""
+        target_time += self.start_time
+        self.container.seek(int(target_time / self.stream.time_base), stream=self.stream, backward=True, any_frame=False)
+        for frame in self.container.decode(self.stream):
+            if frame.time is None or frame.time + 1e-6 >= target_time:
+                return frame
+        return None
+
+    def read_at(self, frame_idx, size=None, color="rgb"):
+        if self.fps <= 0:
+            return None
+        frame = self._seek_time(frame_idx / self.fps)
+        return None if frame is None else self._to_ndarray(frame, size, color)
+
+    def iter_keyframes(self, max_frames, color="rgb"):
+        """让解码器跳过所有非关键帧（skip_frame = "NONKEY"），只解码 I 帧，产出 (时刻, 数组)。"""
+        self.stream.codec_context.skip_frame = "NONKEY"
+        extracted = 0
+        for frame in self.container.decode(self.stream):
+            yield max((frame.time or self.start_time) - self.start_time, 0.0), self._to_ndarray(frame, None, color)
+            extracted += 1
+            if extracted >= max_frames:
+                return
+
+    def iter_every_seconds(self, interval_seconds, max_frames, color="rgb"):
+        """按时间戳跳转到每个采样时刻取帧，产出 (时刻, 数组)。"""
+        duration = None
+        if self.stream.duration is not None and self.stream.time_base is not None:
+            duration = float(self.stream.duration * self.stream.time_base)
+        elif self.container.duration is not None:
+            duration = self.container.duration / self.av.time_base
+
+        for sample_idx in range(max_frames):
+            target_time = sample_idx * interval_seconds
+            if duration is not None and target_time >= duration:
+                return
+            frame = self._seek_time(target_time)
+            if frame is None:
+                return
+            yield target_time, self._to_ndarray(frame, None, color)
+
+    def close(self):
+        self.container.close()
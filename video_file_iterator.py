@@ -1,8 +1,11 @@
 import os
-import glob
-import torch
-import numpy as np
-import cv2  # 导入OpenCV库
+import math
+from .frame_utils import FrameTensorBuilder, fit_max_side, frames_nbytes, resolve_dtype
+from .folder_index import VIDEO_EXTENSIONS, FolderWatcher, ScanOptions, list_file_names
+from .iteration_state import IterationState
+from .work_sharding import LeaseManager, next_shard_index
+from .video_backend import DECODE_BACKENDS, open_video
+from .background_prefetch import BackgroundPrefetcher
 
 # --------------------------------------------------------------------------------
 # Class: VideoFileIterator
@@ -19,6 +22,13 @@ class VideoFileIterator:
         self.index = 0
         self.cached_files = []
         self.cached_folder_path = ""
+        self.cached_natural_sort = False
+        self.cached_scan_options = ScanOptions()
+        self.watcher = None
+        self.state = None
+        self.leases = None
+        # 流水线模式：后台线程在下游运行的同时解码接下来的视频
+        self.prefetcher = BackgroundPrefetcher("VideoFileIterator", size_fn=frames_nbytes)
 
     @classmethod
     def INPUT_TYPES(cls):
@@ -31,6 +41,64 @@ class VideoFileIterator:
                     "multiline": False,
                     "default": "C:\\path\\to\\your\\video_folder"
                 }),
+            },
+            "optional": {
+                # 单个视频解码后允许占用的最大内存（MB），0 表示不限制
+                "max_memory_mb": ("INT", {
+                    "default": 0,
+                    "min": 0,
+                    "max": 1048576,
+                    "step": 256
+                }),
+                # 超出内存上限时的处理方式：拒绝加载 / 抽帧 / 降低分辨率
+                "on_exceed": (["refuse", "stride", "downscale"], {"default": "refuse"}),
+                # 解码时将最长边缩放到该值，0 表示保持原始分辨率
+                "max_side": ("INT", {"default": 0, "min": 0, "max": 16384, "step": 8}),
+                # 输出张量的精度：float16 的帧内存是 float32 的一半，解码时直接写入，不会产生 float32 副本
+                "output_dtype": (["float32", "float16"], {"default": "float32"}),
+                # 解码后端与解码线程数（0 表示由后端自动选择）
+                "decode_backend": (DECODE_BACKENDS, {"default": "opencv"}),
+                "decode_threads": ("INT", {"default": 0, "min": 0, "max": 64, "step": 1}),
+                # 每隔多少帧取一帧，1 表示逐帧读取
+                "frame_stride": ("INT", {"default": 1, "min": 1, "max": 1000, "step": 1}),
+                # 从第几帧开始读取
+                "start_frame": ("INT", {"default": 0, "min": 0, "step": 1}),
+                # 最多读取多少帧，0 表示不限制
+                "max_frames": ("INT", {"default": 0, "min": 0, "step": 1}),
+                # 流水线模式：在后台提前解码接下来的 N 个视频，0 表示关闭（同步加载）
+                "prefetch_depth": ("INT", {"default": 0, "min": 0, "max": 8, "step": 1}),
+                # 提前解码的结果最多占用的内存（MB），0 表示只受 prefetch_depth 限制
+                "prefetch_max_mb": ("INT", {"default": 0, "min": 0, "max": 1048576, "step": 256}),
+                # 自然排序：按文件名中的数字大小排序（clip2 在 clip10 之前）
+                "natural_sort": ("BOOLEAN", {"default": False}),
+                # 递归扫描子文件夹（并发扫描），输出的文件名为相对于文件夹的路径
+                "recursive": ("BOOLEAN", {"default": False}),
+                # 逗号分隔的通配符：只保留 / 排除匹配的文件（含 "/" 的模式匹配相对路径，否则匹配文件名）
+                "include_patterns": ("STRING", {"multiline": False, "default": ""}),
+                "exclude_patterns": ("STRING", {"multiline": False, "default": ""}),
+                # 递归时最多进入几层子文件夹，0 表示不限制
+                "max_depth": ("INT", {"default": 0, "min": 0, "max": 64, "step": 1}),
+                # 监视模式：处理完现有文件后继续等待文件夹中新出现的文件
+                "watch": ("BOOLEAN", {"default": False}),
+                # 监视模式下等待新文件的最长时间（秒），超时后按原逻辑终止
+                "watch_timeout": ("INT", {"default": 300, "min": 1, "max": 86400, "step": 1}),
+                # 断点续传：把迭代位置保存到状态文件，重启后从上次的位置继续
+                "resume": ("BOOLEAN", {"default": False}),
+                # 状态文件目录，留空时保存在被遍历的文件夹内
+                "state_dir": ("STRING", {"multiline": False, "default": ""}),
+                # 重置迭代状态（从第一个文件重新开始）
+                "reset_state": ("BOOLEAN", {"default": False}),
+                # 跳转到指定索引（从 0 开始），-1 表示不跳转
+                "seek_to": ("INT", {"default": -1, "min": -1, "step": 1}),
+                # 多实例分片：none 不分片 / static 按位置静态分片 / dynamic 通过租约文件动态领取
+                "sharding_mode": (["none", "static", "dynamic"], {"default": "none"}),
+                # static 模式：当前实例的分片编号（从 0 开始）与分片总数
+                "shard_index": ("INT", {"default": 0, "min": 0, "max": 1024, "step": 1}),
+                "shard_count": ("INT", {"default": 1, "min": 1, "max": 1024, "step": 1}),
+                # dynamic 模式：租约文件目录（需位于所有实例共享的存储上），留空时使用文件夹内的 .leases 目录
+                "lease_dir": ("STRING", {"multiline": False, "default": ""}),
+                # dynamic 模式：租约有效期（秒），持有者崩溃后超过此时间的文件会被其他实例回收
+                "lease_seconds": ("INT", {"default": 3600, "min": 10, "max": 604800, "step": 10}),
             }
         }
 
@@ -48,80 +116,145 @@ class VideoFileIterator:
         """
         return float("NaN")
         
-    def get_sorted_files(self, folder_path):
+    def get_sorted_files(self, folder_path, natural_sort=False, scan_options=ScanOptions()):
         """
         获取并缓存排序后的视频文件列表。
         """
         if not os.path.isdir(folder_path):
             raise NotADirectoryError(f"路径 '{folder_path}' 不是一个有效的文件夹。")
 
-        if folder_path != self.cached_folder_path:
+        if folder_path != self.cached_folder_path or natural_sort != self.cached_natural_sort \
+                or scan_options != self.cached_scan_options:
             print(f"[VideoFileIterator] 文件夹路径已更改，正在重新扫描: {folder_path}")
             
-            # --- 修改点 2: 搜索多种视频格式 ---
-            video_extensions = ['.mp4', '.mov', '.avi', '.mkv', '.webm']
-            files_found = []
-            for ext in video_extensions:
-                search_pattern = os.path.join(folder_path, f'*{ext}')
-                files_found.extend(glob.glob(search_pattern))
-            
-            video_files = [os.path.basename(f) for f in files_found]
-            video_files.sort()
+            # --- 修改点 2: 单次扫描匹配多种视频格式（扩展名不区分大小写） ---
+            video_files = list_file_names(folder_path, VIDEO_EXTENSIONS, natural_sort, scan_options)
             
             self.cached_folder_path = folder_path
+            self.cached_natural_sort = natural_sort
+            self.cached_scan_options = scan_options
             self.cached_files = video_files
             
             print(f"[VideoFileIterator] 找到并排序了 {len(video_files)} 个视频文件。")
             self.index = 0
+            self.watcher = None
             
         return self.cached_files
 
+    def plan_memory_budget(self, frame_count, width, height, max_memory_mb, on_exceed, bytes_per_value=4):
+        """
+        根据容器记录的帧数与分辨率估算输出张量的大小（默认按float32计算），并在超出内存上限时决定处理方式。
+        返回 (frame_stride, scale)：
+        - frame_stride: 每隔多少帧保留一帧（1 表示保留全部帧）
+        - scale: 分辨率缩放系数（1.0 表示保持原始分辨率）
+        """
+        if max_memory_mb <= 0 or frame_count <= 0 or width <= 0 or height <= 0:
+            return 1, 1.0
+
+        budget_bytes = max_memory_mb * 1024 * 1024
+        estimated_bytes = frame_count * height * width * 3 * bytes_per_value
+        if estimated_bytes <= budget_bytes:
+            return 1, 1.0
+
+        estimated_mb = estimated_bytes / (1024 * 1024)
+        if on_exceed == "stride":
+            frame_stride = math.ceil(estimated_bytes / budget_bytes)
+            print(f"[VideoFileIterator] 预计占用 {estimated_mb:.0f} MB，超过上限 {max_memory_mb} MB，改为每 {frame_stride} 帧取 1 帧。")
+            return frame_stride, 1.0
+        if on_exceed == "downscale":
+            scale = math.sqrt(budget_bytes / estimated_bytes)
+            print(f"[VideoFileIterator] 预计占用 {estimated_mb:.0f} MB，超过上限 {max_memory_mb} MB，分辨率缩放为 {scale:.2f} 倍。")
+            return 1, scale
+        raise MemoryError(f"预计占用 {estimated_mb:.0f} MB，超过内存上限 {max_memory_mb} MB，已拒绝加载。")
+
     # --- 修改点 3: 新增视频加载和转换函数 ---
-    def load_video_frames(self, file_path):
+    def load_video_frames(self, file_path, max_memory_mb=0, on_exceed="refuse", max_side=0, frame_stride=1, start_frame=0, max_frames=0, output_dtype="float32",
+                          decode_backend="opencv", decode_threads=0):
         """
-        使用OpenCV加载视频，并将其所有帧转换为ComfyUI所需的Tensor格式。
+        使用所选的解码后端（OpenCV / PyAV）加载视频，并将其所有帧转换为ComfyUI所需的Tensor格式。
         返回的Tensor形状为 [frame_count, height, width, 3] (RGB)
+        加载前先读取帧数与分辨率，一次性预分配输出张量；
+        若设置了 max_memory_mb，则按 on_exceed 拒绝加载、抽帧或降低分辨率。
+        start_frame / frame_stride / max_frames / max_side 在解码循环内生效：
+        不需要的帧不做颜色转换，缩放在float转换之前完成。
+        output_dtype 决定输出张量的精度，每帧解码后直接以该精度写入。
         """
+        import torch
+        dtype = resolve_dtype(output_dtype)
+        bytes_per_value = torch.empty((), dtype=dtype).element_size()
         try:
-            # 使用OpenCV打开视频文件
-            cap = cv2.VideoCapture(file_path)
-            if not cap.isOpened():
-                raise IOError(f"无法打开视频文件: {os.path.basename(file_path)}")
-
-            frames = []
-            while cap.isOpened():
-                ret, frame = cap.read()
-                if not ret:
-                    break # 视频读取完毕或发生错误
-                
-                # OpenCV默认读取为BGR格式，需要转换为RGB
-                frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                # 将Numpy数组转换为Tensor，并归一化到 [0, 1]
-                frame_tensor = torch.from_numpy(frame_rgb.astype(np.float32) / 255.0)
-                frames.append(frame_tensor)
-            
-            cap.release()
+            with open_video(file_path, decode_backend, decode_threads) as reader:
+                # 先按用户指定的起始帧、步长、最大帧数与最长边估算输出规模
+                kept_estimate = math.ceil(max(reader.frame_count - start_frame, 0) / frame_stride)
+                if max_frames > 0:
+                    kept_estimate = min(kept_estimate, max_frames)
+                out_w, out_h = fit_max_side(reader.width, reader.height, max_side)
 
-            if not frames:
+                # 再按内存上限决定是否额外抽帧或缩放
+                memory_stride, scale = self.plan_memory_budget(kept_estimate, out_w, out_h, max_memory_mb, on_exceed, bytes_per_value)
+                frame_stride *= memory_stride
+                kept_estimate = math.ceil(kept_estimate / memory_stride)
+                if scale < 1.0:
+                    out_w, out_h = max(1, int(out_w * scale)), max(1, int(out_h * scale))
+                target_size = None
+                if (out_w, out_h) != (reader.width, reader.height):
+                    target_size = (out_w, out_h)
+
+                # 按预计保留的帧数预分配输出张量
+                builder = FrameTensorBuilder(kept_estimate, dtype)
+                # 容器元数据不可靠时的兜底：实际写入量不得超过内存上限
+                max_kept_frames = None
+                if max_memory_mb > 0 and out_w > 0 and out_h > 0:
+                    max_kept_frames = max(1, (max_memory_mb * 1024 * 1024) // (out_w * out_h * 3 * bytes_per_value))
+
+                for _, frame_rgb in reader.iter_frames(start_frame, frame_stride, max_frames, target_size, "rgb"):
+                    if max_kept_frames is not None and builder.count >= max_kept_frames:
+                        if on_exceed == "refuse":
+                            raise MemoryError(f"实际帧数超过容器记录，加载将超出内存上限 {max_memory_mb} MB，已拒绝加载。")
+                        print(f"[VideoFileIterator] 已达到内存上限 {max_memory_mb} MB，提前停止读取（保留 {builder.count} 帧）。")
+                        break
+                    # 写入预分配的Tensor，并在原地归一化到 [0, 1]
+                    builder.append(frame_rgb)
+
+            frames_tensor = builder.result()
+            if frames_tensor is None:
                 raise ValueError(f"视频文件 '{os.path.basename(file_path)}' 为空或无法解码。")
 
-            # 将帧列表堆叠成一个批次张量
-            return torch.stack(frames)
+            return frames_tensor
             
         except Exception as e:
-            # 确保即使出错也释放资源
-            if 'cap' in locals() and cap.isOpened():
-                cap.release()
             raise IOError(f"加载或转换视频时发生错误: {os.path.basename(file_path)} - {e}")
 
-    def iterate_and_load_video(self, folder_path):
+    def iterate_and_load_video(self, folder_path, max_memory_mb=0, on_exceed="refuse", max_side=0, output_dtype="float32", decode_backend="opencv",
+                               decode_threads=0, frame_stride=1, start_frame=0, max_frames=0, prefetch_depth=0, prefetch_max_mb=0, natural_sort=False, recursive=False, include_patterns="", exclude_patterns="", max_depth=0, watch=False, watch_timeout=300, resume=False, state_dir="", reset_state=False, seek_to=-1,
+                               sharding_mode="none", shard_index=0, shard_count=1, lease_dir="", lease_seconds=3600):
         """
         节点的主执行函数。
         """
+        scan_options = ScanOptions(recursive, include_patterns, exclude_patterns, max_depth)
         try:
-            video_files = self.get_sorted_files(folder_path)
+            video_files = self.get_sorted_files(folder_path, natural_sort, scan_options)
         except Exception as e:
             raise e
+
+        # 断点续传：恢复并更新持久化的迭代位置
+        if resume:
+            self.state, self.index = IterationState.sync(self.state, "VideoFileIterator", folder_path, video_files, self.index, state_dir, reset_state, seek_to)
+        else:
+            self.state = None
+
+        # 多实例分片：把上一次输出的文件标记为完成，并定位到下一个属于当前实例的文件
+        leases = None
+        if sharding_mode == "dynamic":
+            self.leases = leases = LeaseManager.for_source(self.leases, folder_path, lease_dir, lease_seconds)
+            leases.commit_in_flight()
+        self.index = next_shard_index(video_files, self.index, sharding_mode, shard_index, shard_count, leases)
+
+        # 监视模式：追加新文件；队列已处理完时阻塞等待
+        if watch:
+            self.watcher, video_files = FolderWatcher.append_new_files(self.watcher, "VideoFileIterator", folder_path, VIDEO_EXTENSIONS, self.cached_files, natural_sort,
+                self.index >= len(video_files), watch_timeout, scan_options)
+            self.index = next_shard_index(video_files, self.index, sharding_mode, shard_index, shard_count, leases)
             
         num_files = len(video_files)
 
@@ -131,6 +264,9 @@ class VideoFileIterator:
         # 核心终止逻辑不变
         if self.index >= num_files:
             self.index = 0
+            self.prefetcher.reset()
+            if self.state is not None:
+                self.state.finish()
             raise Exception(f"所有 {num_files} 个视频已处理完毕。工作流已终止。若要重新开始，请再次点击'Queue Prompt'。")
 
         filename = video_files[self.index]
@@ -138,14 +274,38 @@ class VideoFileIterator:
         
         print(f"[VideoFileIterator] 正在处理: 视频 {self.index + 1}/{num_files} - {filename}")
         
+        # 影响解码结果的全部参数，改变时丢弃已提前解码的结果
+        load_params = (max_memory_mb, on_exceed, max_side, frame_stride, start_frame, max_frames, output_dtype, decode_backend, decode_threads)
+        prefetched = self.prefetcher.take(self.index, filename, (folder_path, *load_params)) if prefetch_depth > 0 else None
+
         try:
             # --- 修改点 4: 调用新的视频加载函数 ---
-            video_frames_tensor = self.load_video_frames(full_path)
+            if prefetched is not None:
+                video_frames_tensor = prefetched.result()
+            else:
+                video_frames_tensor = self.load_video_frames(full_path, *load_params)
         except Exception as e:
             self.index += 1
+            if self.state is not None:
+                self.state.deliver([filename], self.index)
+            if leases is not None:
+                leases.deliver([filename])
             raise e
         
         self.index += 1
+        if self.state is not None:
+            self.state.deliver([filename], self.index)
+        if leases is not None:
+            leases.deliver([filename])
+
+        # 流水线模式：当前结果交给下游后，后台开始解码接下来的视频
+        # dynamic 分片下后续文件可能被其他实例领取，不提前解码
+        if prefetch_depth > 0 and sharding_mode != "dynamic":
+            next_index = next_shard_index(video_files, self.index, sharding_mode, shard_index, shard_count)
+            step = shard_count if sharding_mode == "static" else 1
+            upcoming = [(i, video_files[i]) for i in range(next_index, num_files, step)[:prefetch_depth]]
+            self.prefetcher.schedule(upcoming, lambda name: self.load_video_frames(os.path.join(folder_path, name), *load_params),
+                                     (folder_path, *load_params), prefetch_depth, prefetch_max_mb)
         
         filename_no_ext = os.path.splitext(filename)[0]
         
@@ -1,22 +1,18 @@
 import os
 import logging
-import cv2
-import numpy as np
-from PIL import Image
 import base64
 import io
+from concurrent.futures import ThreadPoolExecutor
+from .content_item_cache import ContentItemCache
+from .folder_index import VIDEO_EXTENSIONS, ScanOptions, list_file_names
+from .iteration_state import IterationState
+from .lazy_imports import require
+from .video_backend import DECODE_BACKENDS, open_video
+from .background_prefetch import BackgroundPrefetcher
 
 # --- 依赖项和日志设置 ---
-try:
-    import cv2
-except ImportError:
-    raise ImportError("OpenCV (cv2) is not installed. Please install it by running: pip install opencv-python")
-
-try:
-    from PIL import Image
-    import numpy as np
-except ImportError:
-    raise ImportError("Pillow or numpy is not installed. Please ensure your ComfyUI environment is set up correctly.")
+# 解码后端（OpenCV / PyAV）与 Pillow 在节点第一次执行时才导入（见 lazy_imports）；
+# 视频解码通过 video_backend 完成，keyframes_only / every_n_seconds 取帧模式固定使用 PyAV。
 
 logger = logging.getLogger('VideoFramesByIntervalIterator')
 # --------------------
@@ -24,12 +20,29 @@ logger = logging.getLogger('VideoFramesByIntervalIterator')
 CONTENT_ITEM_TYPE = "OAI_CONTENT_ITEM"
 MAX_OUTPUT_FRAMES = 10  # 定义节点最多可以输出多少个帧端口
 
+
+def content_items_nbytes(content_items):
+    """CONTENT_ITEM 列表中 data URL 的总长度（用于预读取的内存上限）。"""
+    if not content_items:
+        return 0
+    return sum(len(item["input_image"]["image_url"]) for item in content_items)
+
 class VideoFramesByIntervalIteratorNode:
     def __init__(self):
         # 迭代器状态管理
         self.index = 0
         self.cached_files = []
         self.cached_folder_path = ""
+        self.cached_natural_sort = False
+        self.cached_scan_options = ScanOptions()
+        self.state = None
+        # 帧编码线程池（按需创建）
+        self._encode_executor = None
+        self._encode_workers = 0
+        # 抽帧结果的磁盘缓存（设置 cache_dir 后启用）
+        self._content_cache = None
+        # 流水线模式：后台线程提前抽取接下来的视频，结果为 CONTENT_ITEM 列表
+        self.prefetcher = BackgroundPrefetcher("VideoFramesIntervalIterator", size_fn=content_items_nbytes)
 
     @classmethod
     def INPUT_TYPES(cls):
@@ -53,6 +66,46 @@ class VideoFramesByIntervalIteratorNode:
                 }),
                 "image_format": (["jpeg", "png", "webp"], {"default": "jpeg"}),
                 "quality": ("INT", {"default": 85, "min": 10, "max": 100, "step": 1}),
+            },
+            "optional": {
+                # 采样模式：按帧间隔 / 仅关键帧 / 每隔 N 秒（后两种使用 PyAV 解码）
+                "sampling_mode": (["frame_interval", "keyframes_only", "every_n_seconds"], {"default": "frame_interval"}),
+                # every_n_seconds 模式下的采样间隔（秒）
+                "interval_seconds": ("FLOAT", {"default": 1.0, "min": 0.01, "max": 3600.0, "step": 0.1}),
+                # 取帧方式：auto 根据间隔与 GOP 大小自动选择顺序读取或跳转
+                "sampling_strategy": (["auto", "sequential", "seek"], {"default": "auto"}),
+                # GOP（关键帧间隔）大小，0 表示按帧率估算
+                "gop_size": ("INT", {"default": 0, "min": 0, "max": 10000, "step": 1}),
+                # frame_interval 模式的解码后端，以及解码线程数（0 表示由后端自动选择）
+                "decode_backend": (DECODE_BACKENDS, {"default": "opencv"}),
+                "decode_threads": ("INT", {"default": 0, "min": 0, "max": 64, "step": 1}),
+                # 并行编码线程数，0 表示按CPU核数自动选择，1 表示串行编码
+                "encode_workers": ("INT", {"default": 0, "min": 0, "max": 64, "step": 1}),
+                # 抽帧结果的磁盘缓存目录，留空表示不使用缓存
+                "cache_dir": ("STRING", {"multiline": False, "default": ""}),
+                # 磁盘缓存的大小上限（MB），超出后按最近访问时间淘汰
+                "cache_max_mb": ("INT", {"default": 1024, "min": 1, "max": 1048576, "step": 64}),
+                # 流水线模式：在后台提前抽取接下来的 N 个视频，0 表示关闭
+                "prefetch_depth": ("INT", {"default": 0, "min": 0, "max": 8, "step": 1}),
+                # 提前抽取的结果最多占用的内存（MB），0 表示只受 prefetch_depth 限制
+                "prefetch_max_mb": ("INT", {"default": 0, "min": 0, "max": 1048576, "step": 64}),
+                # 自然排序：按文件名中的数字大小排序（clip2 在 clip10 之前）
+                "natural_sort": ("BOOLEAN", {"default": False}),
+                # 递归扫描子文件夹（并发扫描），输出的文件名为相对于文件夹的路径
+                "recursive": ("BOOLEAN", {"default": False}),
+                # 逗号分隔的通配符：只保留 / 排除匹配的文件（含 "/" 的模式匹配相对路径，否则匹配文件名）
+                "include_patterns": ("STRING", {"multiline": False, "default": ""}),
+                "exclude_patterns": ("STRING", {"multiline": False, "default": ""}),
+                # 递归时最多进入几层子文件夹，0 表示不限制
+                "max_depth": ("INT", {"default": 0, "min": 0, "max": 64, "step": 1}),
+                # 断点续传：把迭代位置保存到状态文件，重启后从上次的位置继续
+                "resume": ("BOOLEAN", {"default": False}),
+                # 状态文件目录，留空时保存在被遍历的文件夹内
+                "state_dir": ("STRING", {"multiline": False, "default": ""}),
+                # 重置迭代状态（从第一个文件重新开始）
+                "reset_state": ("BOOLEAN", {"default": False}),
+                # 跳转到指定索引（从 0 开始），-1 表示不跳转
+                "seek_to": ("INT", {"default": -1, "min": -1, "step": 1}),
             }
         }
 
@@ -67,32 +120,32 @@ class VideoFramesByIntervalIteratorNode:
         """强制节点重新运行以实现迭代"""
         return float("NaN")
 
-    def get_sorted_video_files(self, folder_path):
+    def get_sorted_video_files(self, folder_path, natural_sort=False, scan_options=ScanOptions()):
         """获取并缓存排序后的视频文件列表"""
         if not os.path.isdir(folder_path):
             raise NotADirectoryError(f"路径 '{folder_path}' 不是一个有效的文件夹。")
 
-        if folder_path != self.cached_folder_path:
+        if folder_path != self.cached_folder_path or natural_sort != self.cached_natural_sort \
+                or scan_options != self.cached_scan_options:
             logger.info(f"[VideoFramesIntervalIterator] 文件夹路径已更改，正在重新扫描: {folder_path}")
             try:
-                video_extensions = {".mp4", ".mov", ".avi", ".mkv", ".webm"}
-                all_entries = os.listdir(folder_path)
-                files_found = [f for f in all_entries if os.path.splitext(f)[1].lower() in video_extensions]
-                files_found.sort()
+                files_found = list_file_names(folder_path, VIDEO_EXTENSIONS, natural_sort, scan_options)
             except Exception as e:
                 raise IOError(f"无法读取文件夹 '{folder_path}': {e}")
             
             self.cached_folder_path = folder_path
+            self.cached_natural_sort = natural_sort
+            self.cached_scan_options = scan_options
             self.cached_files = files_found
             logger.info(f"[VideoFramesIntervalIterator] 找到并排序了 {len(files_found)} 个视频文件。")
             self.index = 0
         return self.cached_files
 
     def _encode_frame_to_content_item(self, frame, image_format, quality):
-        """将单个OpenCV帧编码为CONTENT_ITEM字典"""
+        """将单个RGB帧编码为CONTENT_ITEM字典（颜色转换已由解码后端完成）"""
+        Image = require("PIL.Image")
         try:
-            frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            img = Image.fromarray(frame_rgb)
+            img = Image.fromarray(frame)
             if image_format.lower() == 'jpeg' and img.mode == 'RGBA':
                 img = img.convert('RGB')
             buffer = io.BytesIO()
@@ -101,55 +154,223 @@ class VideoFramesByIntervalIteratorNode:
                 save_params['quality'] = quality
             img.save(buffer, format=image_format.upper(), **save_params)
             base64_data = base64.b64encode(buffer.getvalue()).decode('utf-8')
-            mime_type = f"image/{image_format.lower()}"
-            data_url = f"data:{mime_type};base64,{base64_data}"
-            content_item = {"input_image": {"image_url": data_url, "detail": "high"}}
-            return content_item
+            return self._build_content_item(base64_data, image_format)
         except Exception as e:
             logger.error(f"帧编码失败: {e}")
             return None
 
-    def iterate_and_extract(self, folder_path: str, frame_interval: int, max_frames_to_extract: int, image_format: str, quality: int):
-        video_files = self.get_sorted_video_files(folder_path)
+    def _build_content_item(self, base64_data, image_format):
+        """将base64编码的图片数据包装为CONTENT_ITEM字典"""
+        mime_type = f"image/{image_format.lower()}"
+        data_url = f"data:{mime_type};base64,{base64_data}"
+        return {"input_image": {"image_url": data_url, "detail": "high"}}
+
+    def _get_content_cache(self, cache_dir, cache_max_mb):
+        """返回与 cache_dir 对应的磁盘缓存；cache_dir 为空时返回 None。"""
+        if not cache_dir:
+            return None
+        if self._content_cache is None or self._content_cache.cache_dir != cache_dir:
+            self._content_cache = ContentItemCache(cache_dir, cache_max_mb)
+        self._content_cache.max_size_bytes = cache_max_mb * 1024 * 1024
+        return self._content_cache
+
+    def _get_encode_executor(self, encode_workers, max_frames_to_extract):
+        """
+        返回用于帧编码的线程池；encode_workers 为 1 时返回 None（串行编码）。
+        PIL 在 JPEG/PNG/WebP 编码器内部会释放 GIL，因此线程池即可并行编码。
+        """
+        if encode_workers == 0:
+            encode_workers = min(max_frames_to_extract, os.cpu_count() or 1)
+        if encode_workers <= 1:
+            return None
+        if self._encode_executor is None or self._encode_workers != encode_workers:
+            if self._encode_executor is not None:
+                self._encode_executor.shutdown(wait=False)
+            self._encode_executor = ThreadPoolExecutor(max_workers=encode_workers, thread_name_prefix="VideoFramesEncoder")
+            self._encode_workers = encode_workers
+        return self._encode_executor
+
+    def _choose_sampling_strategy(self, reader, frame_interval, sampling_strategy, gop_size):
+        """
+        auto 模式下根据采样间隔与 GOP 大小选择取帧方式：
+        - sequential: 顺序解码，只对保留的帧做颜色转换（OpenCV 下为 grab() 跳过、retrieve() 保留）。
+          代价约为 frame_interval 次解码。
+        - seek: 每个采样点跳转一次。长 GOP 编码下每次跳转都要从前一个关键帧重新解码，
+          代价约为 GOP 大小的一部分加上跳转本身的开销。
+        因此当采样间隔不超过 GOP 大小时顺序读取更快，否则跳转更快。
+        """
+        if sampling_strategy != "auto":
+            return sampling_strategy
+        if gop_size <= 0:
+            # 无法可靠读取 GOP 大小，按常见编码设置（约 2 秒一个关键帧，至少 12 帧）估算
+            fps = reader.fps
+            gop_size = max(int(round(fps * 2)), 12) if fps and fps > 0 else 250
+        return "sequential" if frame_interval <= gop_size else "seek"
+
+    def _sample_frames(self, reader, frame_interval, max_frames_to_extract, strategy):
+        """
+        按间隔依次产出 (帧序号, RGB帧)。只有被采样的帧会被转换为图像。
+        """
+        if strategy == "seek":
+            extracted = 0
+            current_frame_idx = 0
+            while current_frame_idx < reader.frame_count and extracted < max_frames_to_extract:
+                frame = reader.read_at(current_frame_idx, color="rgb")
+                if frame is None:
+                    logger.warning(f"  > 读取第 {current_frame_idx} 帧失败，提前结束提取。")
+                    return
+                yield current_frame_idx, frame
+                extracted += 1
+                current_frame_idx += frame_interval
+            return
+
+        # sequential: 顺序解码，仅在采样点转换；帧缓冲区会被复用，编码线程需要自己的拷贝
+        for frame_idx, frame in reader.iter_frames(0, frame_interval, max_frames_to_extract, color="rgb"):
+            yield frame_idx, frame.copy()
+
+    def _sample_frames_pyav(self, reader, sampling_mode, interval_seconds, max_frames_to_extract):
+        """
+        使用 PyAV 按关键帧或按时间取帧，依次产出 (位置描述, RGB帧)。
+        - keyframes_only: 让解码器跳过所有非关键帧，只解码 I 帧。
+        - every_n_seconds: 按时间戳跳转到每个采样时刻，从最近的关键帧解码到目标时刻。
+        """
+        if sampling_mode == "keyframes_only":
+            for frame_time, frame in reader.iter_keyframes(max_frames_to_extract, color="rgb"):
+                yield f"{frame_time:.2f} 秒 (关键帧)", frame
+            return
+
+        for target_time, frame in reader.iter_every_seconds(interval_seconds, max_frames_to_extract, color="rgb"):
+            yield f"{target_time:.2f} 秒", frame
+
+    def extract_content_items(self, full_video_path, cache, executor, frame_interval, max_frames_to_extract, image_format, quality,
+                              sampling_mode, interval_seconds, sampling_strategy, gop_size, decode_backend, decode_threads):
+        """
+        从一个视频中取帧并编码，返回 CONTENT_ITEM 列表；无法打开视频时返回 None。
+        流水线模式下该方法也会在后台线程中为接下来的视频执行。
+        """
+        video_filename = os.path.basename(full_video_path)
+
+        # 命中磁盘缓存时直接返回，完全不打开视频
+        cache_key = None
+        if cache is not None:
+            sampling_params = {"sampling_mode": sampling_mode, "max_frames_to_extract": max_frames_to_extract,
+                               "image_format": image_format.lower(), "quality": quality}
+            if sampling_mode == "frame_interval":
+                sampling_params["frame_interval"] = frame_interval
+            elif sampling_mode == "every_n_seconds":
+                sampling_params["interval_seconds"] = interval_seconds
+            try:
+                cache_key = ContentItemCache.make_key(full_video_path, **sampling_params)
+            except OSError as e:
+                # 视频在扫描之后被删除或无法访问：不使用缓存，交给下面的打开逻辑报告错误
+                logger.warning(f"无法为 '{video_filename}' 生成缓存键，跳过缓存: {e}")
+                cache = None
+        if cache is not None:
+            entry = cache.get(cache_key)
+            if entry is not None:
+                content_items = [self._build_content_item(data, image_format) for data in entry["frames"]]
+                logger.info(f"从缓存中读取了 '{video_filename}' 的 {len(content_items)} 帧。")
+                return content_items
+
+        # keyframes_only / every_n_seconds 依赖 PyAV 的关键帧与时间戳跳转，固定使用 PyAV 后端
+        backend = decode_backend if sampling_mode == "frame_interval" else "pyav"
+        try:
+            # 后端缺失时 ImportError 直接抛出，而不是被当作无法打开视频
+            reader = open_video(full_video_path, backend, decode_threads)
+        except IOError as e:
+            logger.error(f"无法打开视频: {video_filename} - {e}")
+            return None
+
+        if sampling_mode == "frame_interval":
+            strategy = self._choose_sampling_strategy(reader, frame_interval, sampling_strategy, gop_size)
+            logger.info(f"[VideoFramesIntervalIterator] 取帧方式: {strategy}")
+            samples = ((f"第 {idx} 帧", frame) for idx, frame in self._sample_frames(reader, frame_interval, max_frames_to_extract, strategy))
+        else:
+            logger.info(f"[VideoFramesIntervalIterator] 采样模式: {sampling_mode}")
+            samples = self._sample_frames_pyav(reader, sampling_mode, interval_seconds, max_frames_to_extract)
+
+        # 每取到一帧就立即提交编码，编码与下一个采样点的解码重叠进行；结果按提交顺序收集
+        pending = []
+        try:
+            for position, frame in samples:
+                if executor is not None:
+                    pending.append((position, executor.submit(self._encode_frame_to_content_item, frame, image_format, quality)))
+                else:
+                    pending.append((position, self._encode_frame_to_content_item(frame, image_format, quality)))
+        except Exception as e:
+            logger.error(f"读取视频 '{video_filename}' 时出错，提前结束提取: {e}")
+        finally:
+            reader.close()
+
+        content_items = []
+        for position, result in pending:
+            content_item = result.result() if executor is not None else result
+            if content_item:
+                content_items.append(content_item)
+                logger.info(f"  > 已提取第 {len(content_items)} 帧 (位于视频的{position})")
+        logger.info(f"成功从 '{video_filename}' 提取了 {len(content_items)} 帧。")
+
+        if cache is not None and content_items:
+            frames = [item["input_image"]["image_url"].split(",", 1)[1] for item in content_items]
+            cache.put(cache_key, f"image/{image_format.lower()}", frames)
+        return content_items
+
+    def iterate_and_extract(self, folder_path: str, frame_interval: int, max_frames_to_extract: int, image_format: str, quality: int,
+                            sampling_mode: str = "frame_interval", interval_seconds: float = 1.0,
+                            sampling_strategy: str = "auto", gop_size: int = 0, decode_backend: str = "opencv", decode_threads: int = 0,
+                            encode_workers: int = 0,
+                            cache_dir: str = "", cache_max_mb: int = 1024, prefetch_depth: int = 0, prefetch_max_mb: int = 0, natural_sort: bool = False,
+                            recursive: bool = False, include_patterns: str = "", exclude_patterns: str = "", max_depth: int = 0,
+                            resume: bool = False, state_dir: str = "", reset_state: bool = False, seek_to: int = -1):
+        scan_options = ScanOptions(recursive, include_patterns, exclude_patterns, max_depth)
+        video_files = self.get_sorted_video_files(folder_path, natural_sort, scan_options)
         num_videos = len(video_files)
 
         if num_videos == 0:
             raise FileNotFoundError(f"在文件夹 '{folder_path}' 中没有找到任何视频文件。")
 
+        # 断点续传：恢复并更新持久化的迭代位置
+        if resume:
+            self.state, self.index = IterationState.sync(self.state, "VideoFramesByIntervalIterator", folder_path, video_files, self.index, state_dir, reset_state, seek_to)
+        else:
+            self.state = None
+
         if self.index >= num_videos:
             self.index = 0
+            self.prefetcher.reset()
+            if self.state is not None:
+                self.state.finish()
             raise Exception(f"所有 {num_videos} 个视频已处理完毕。工作流已终止。")
 
         video_filename = video_files[self.index]
         full_video_path = os.path.join(folder_path, video_filename)
+
+        # 影响抽帧结果的全部参数，改变时丢弃已提前抽取的结果
+        extract_params = (frame_interval, max_frames_to_extract, image_format, quality, sampling_mode, interval_seconds,
+                          sampling_strategy, gop_size, decode_backend, decode_threads)
+        prefetch_key = (folder_path, cache_dir, *extract_params)
+        prefetched = self.prefetcher.take(self.index, video_filename, prefetch_key) if prefetch_depth > 0 else None
         
         logger.info(f"[VideoFramesIntervalIterator] 正在处理视频 {self.index + 1}/{num_videos}: {video_filename}")
         self.index += 1
+        if self.state is not None:
+            self.state.deliver([video_filename], self.index)
 
-        cap = cv2.VideoCapture(full_video_path)
-        if not cap.isOpened():
-            logger.error(f"无法打开视频: {video_filename}")
-            return tuple([None] * MAX_OUTPUT_FRAMES + [video_filename])
+        cache = self._get_content_cache(cache_dir, cache_max_mb)
+        executor = self._get_encode_executor(encode_workers, max_frames_to_extract)
+        if prefetched is not None:
+            content_items = prefetched.result()
+        else:
+            content_items = self.extract_content_items(full_video_path, cache, executor, *extract_params)
 
-        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-        content_items = []
-        current_frame_idx = 0
-
-        while current_frame_idx < total_frames and len(content_items) < max_frames_to_extract:
-            cap.set(cv2.CAP_PROP_POS_FRAMES, current_frame_idx)
-            ret, frame = cap.read()
-            if ret:
-                content_item = self._encode_frame_to_content_item(frame, image_format, quality)
-                if content_item:
-                    content_items.append(content_item)
-                    logger.info(f"  > 已提取第 {len(content_items)} 帧 (位于视频的第 {current_frame_idx} 帧)")
-            else:
-                logger.warning(f"  > 读取第 {current_frame_idx} 帧失败，提前结束提取。")
-                break
-            current_frame_idx += frame_interval
-        
-        cap.release()
-        logger.info(f"成功从 '{video_filename}' 提取了 {len(content_items)} 帧。")
+        # 流水线模式：当前结果交给下游后，后台开始抽取接下来的视频
+        if prefetch_depth > 0:
+            upcoming = [(i, video_files[i]) for i in range(self.index, min(self.index + prefetch_depth, num_videos))]
+            self.prefetcher.schedule(upcoming, lambda name: self.extract_content_items(os.path.join(folder_path, name), cache, executor, *extract_params),
+                                     prefetch_key, prefetch_depth, prefetch_max_mb)
+
+        if content_items is None:
+            return tuple([None] * MAX_OUTPUT_FRAMES + [video_filename])
 
         output_list = content_items + [None] * (MAX_OUTPUT_FRAMES - len(content_items))
         output_list.append(os.path.splitext(video_filename)[0])
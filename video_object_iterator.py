@@ -1,73 +1,70 @@
 # --- START OF FILE video_object_iterator.py (DEFINITIVE FINAL VERSION) ---
 
 import os
-import glob
-import torch
-import av
-import imageio
-import numpy as np
-from comfy_api.input import VideoInput
+import math
+import functools
+from .frame_utils import FrameTensorBuilder, fit_max_side, frames_nbytes, resolve_dtype
+from .folder_index import VIDEO_EXTENSIONS, ScanOptions, list_file_names
+from .iteration_state import IterationState
+from .lazy_imports import require
+from .video_backend import DECODE_BACKENDS, open_video
+from .background_prefetch import BackgroundPrefetcher
 
 # --------------------------------------------------------------------------------
-# 1. 创建一个简单的“数据容器”类，作为 VideoInputComponents 的替代品
-# --------------------------------------------------------------------------------
-class SimpleVideoComponents:
-    """一个简单的数据类，用于封装视频组件，以兼容旧版 ComfyUI API。"""
-    def __init__(self, images, frame_rate, frame_count):
-        self.images = images
-        self.frame_rate = frame_rate
-        self.frame_count = frame_count
-
-# --------------------------------------------------------------------------------
-# 2. 定义我们的具体视频类，让它返回上面创建的简单对象
-# --------------------------------------------------------------------------------
-class LoadedVideo(VideoInput):
-    """
-    一个具体的 VideoInput 实现，用于包装从文件中加载的视频数据。
-    """
-    def __init__(self, images_tensor: torch.Tensor, frame_rate: float, frame_count: int):
-        self.images = images_tensor
-        self.frame_rate = frame_rate
-        self.frame_count = frame_count
-
-    # --- 核心修正点 ---
-    def get_components(self):
-        """
-        实现抽象方法：返回视频的核心组件。
-        这次返回我们自己定义的 SimpleVideoComponents 对象，而不是元组。
-        """
-        return SimpleVideoComponents(
-            images=self.images,
-            frame_rate=self.frame_rate,
-            frame_count=self.frame_count
-        )
-
-    def save_to(self, folder: str, file_prefix: str = "ComfyUI", ext: str = "mp4") -> list[str]:
-        """
-        实现抽象方法：允许在 ComfyUI 中右键保存视频。
-        """
-        try:
-            filepath = os.path.join(folder, f"{file_prefix}_{self.frame_count}frames.{ext}")
-            frames_np = (self.images.cpu().numpy() * 255).astype(np.uint8)
-            imageio.mimsave(filepath, frames_np, fps=self.frame_rate, quality=8)
-            print(f"[VideoObjectIterator] Video saved to: {filepath}")
-            return [filepath]
-        except Exception as e:
-            print(f"Error saving video: {e}")
-            return []
-
-# --------------------------------------------------------------------------------
-# 3. 迭代器类本身不需要修改
+# 3. 迭代器类本身（1、2 部分的 VIDEO 对象类在 video_objects.py 中，
+#    它依赖 comfy_api / av，只在节点第一次执行时才导入）
 # --------------------------------------------------------------------------------
 class VideoObjectIterator:
     def __init__(self):
         self.index = 0
         self.cached_files = []
         self.cached_folder_path = ""
+        self.cached_natural_sort = False
+        self.cached_scan_options = ScanOptions()
+        self.state = None
+        # 流水线模式：后台线程提前解码接下来的视频，结果为 (frames_tensor, fps, frame_count)
+        self.prefetcher = BackgroundPrefetcher("VideoObjectIterator", size_fn=lambda loaded: frames_nbytes(loaded[0]))
 
     @classmethod
     def INPUT_TYPES(cls):
-        return { "required": { "folder_path": ("STRING", { "multiline": False, "default": "C:\\path\\to\\your\\video_folder" }) } }
+        return {
+            "required": { "folder_path": ("STRING", { "multiline": False, "default": "C:\\path\\to\\your\\video_folder" }) },
+            "optional": {
+                "max_side": ("INT", { "default": 0, "min": 0, "max": 16384, "step": 8 }),
+                # 帧的保存精度：float16 减半内存；uint8 只保存原始字节，下游读取帧时才转换为 float32
+                "output_dtype": (["float32", "float16", "uint8"], { "default": "float32" }),
+                # 解码后端与解码线程数（0 表示由后端自动选择）
+                "decode_backend": (DECODE_BACKENDS, { "default": "pyav" }),
+                "decode_threads": ("INT", { "default": 0, "min": 0, "max": 64, "step": 1 }),
+                "frame_stride": ("INT", { "default": 1, "min": 1, "max": 1000, "step": 1 }),
+                "start_frame": ("INT", { "default": 0, "min": 0, "step": 1 }),
+                "max_frames": ("INT", { "default": 0, "min": 0, "step": 1 }),
+                # 按需解码：只探测元数据，下游第一次读取帧时才解码
+                "lazy_decode": ("BOOLEAN", { "default": False }),
+                # 按需解码时是否缓存解码结果
+                "memoize_frames": ("BOOLEAN", { "default": True }),
+                # 流水线模式：在后台提前解码接下来的 N 个视频（按需解码时不生效），0 表示关闭
+                "prefetch_depth": ("INT", { "default": 0, "min": 0, "max": 8, "step": 1 }),
+                # 提前解码的结果最多占用的内存（MB），0 表示只受 prefetch_depth 限制
+                "prefetch_max_mb": ("INT", { "default": 0, "min": 0, "max": 1048576, "step": 256 }),
+                # 保存（save_to）时的编码器、CRF（-1 表示编码器默认值）与编码线程数（0 表示自动）
+                "save_codec": (["libx264", "libx265", "libvpx-vp9"], { "default": "libx264" }),
+                "save_crf": ("INT", { "default": 19, "min": -1, "max": 63, "step": 1 }),
+                "save_threads": ("INT", { "default": 0, "min": 0, "max": 64, "step": 1 }),
+                "natural_sort": ("BOOLEAN", { "default": False }),
+                # 递归扫描子文件夹（并发扫描），输出的文件名为相对于文件夹的路径
+                "recursive": ("BOOLEAN", { "default": False }),
+                # 逗号分隔的通配符：只保留 / 排除匹配的文件（含 "/" 的模式匹配相对路径，否则匹配文件名）
+                "include_patterns": ("STRING", { "multiline": False, "default": "" }),
+                "exclude_patterns": ("STRING", { "multiline": False, "default": "" }),
+                # 递归时最多进入几层子文件夹，0 表示不限制
+                "max_depth": ("INT", { "default": 0, "min": 0, "max": 64, "step": 1 }),
+                "resume": ("BOOLEAN", { "default": False }),
+                "state_dir": ("STRING", { "multiline": False, "default": "" }),
+                "reset_state": ("BOOLEAN", { "default": False }),
+                "seek_to": ("INT", { "default": -1, "min": -1, "step": 1 }),
+            }
+        }
 
     RETURN_TYPES = ("VIDEO", "STRING")
     RETURN_NAMES = ("video", "filename")
@@ -78,51 +75,117 @@ class VideoObjectIterator:
     def IS_CHANGED(cls, *args, **kwargs):
         return float("NaN")
         
-    def get_sorted_files(self, folder_path):
+    def get_sorted_files(self, folder_path, natural_sort=False, scan_options=ScanOptions()):
         if not os.path.isdir(folder_path):
             raise NotADirectoryError(f"路径 '{folder_path}' 不是一个有效的文件夹。")
-        if folder_path != self.cached_folder_path:
+        if folder_path != self.cached_folder_path or natural_sort != self.cached_natural_sort \
+                or scan_options != self.cached_scan_options:
             print(f"[VideoObjectIterator] 文件夹路径已更改，正在重新扫描: {folder_path}")
-            video_extensions = ['.mp4', '.mov', '.avi', '.mkv', '.webm']
-            files_found = []
-            for ext in video_extensions:
-                files_found.extend(glob.glob(os.path.join(folder_path, f'*{ext}')))
-            video_files = sorted([os.path.basename(f) for f in files_found])
+            video_files = list_file_names(folder_path, VIDEO_EXTENSIONS, natural_sort, scan_options)
             self.cached_folder_path = folder_path
+            self.cached_natural_sort = natural_sort
+            self.cached_scan_options = scan_options
             self.cached_files = video_files
             print(f"[VideoObjectIterator] 找到并排序了 {len(video_files)} 个视频文件。")
             self.index = 0
         return self.cached_files
 
-    def load_video_from_path(self, video_path):
+    def probe_video(self, video_path, decode_backend="pyav"):
+        """只读取容器元数据，不解码任何帧。返回 (fps, frame_count, width, height)。"""
+        try:
+            with open_video(video_path, decode_backend) as reader:
+                return reader.fps, reader.frame_count, reader.width, reader.height
+        except Exception as e:
+            raise IOError(f"读取视频 '{video_path}' 的元数据时出错: {e}") from e
+
+    def load_video_from_path(self, video_path, max_side=0, frame_stride=1, start_frame=0, max_frames=0, output_dtype="float32",
+                             decode_backend="pyav", decode_threads=0):
         try:
-            with av.open(video_path) as container:
-                frames = [torch.from_numpy(frame.to_ndarray(format='rgb24')) for frame in container.decode(video=0)]
-                if not frames:
+            with open_video(video_path, decode_backend, decode_threads) as reader:
+                kept_estimate = math.ceil(max(reader.frame_count - start_frame, 0) / frame_stride)
+                if max_frames > 0:
+                    kept_estimate = min(kept_estimate, max_frames)
+                # 缩放在颜色转换时一并完成，不会产生全分辨率的中间数组
+                out_size = fit_max_side(reader.width, reader.height, max_side)
+                # 每帧解码后直接以 output_dtype 写入预分配的张量，避免先堆叠uint8再整体转换
+                builder = FrameTensorBuilder(kept_estimate, resolve_dtype(output_dtype))
+                for _, frame_rgb in reader.iter_frames(start_frame, frame_stride, max_frames, out_size, "rgb"):
+                    builder.append(frame_rgb)
+                frames_tensor = builder.result()
+                if frames_tensor is None:
                     raise ValueError(f"无法从视频 '{video_path}' 解码任何帧。")
-                frames_tensor = torch.stack(frames).to(torch.float32) / 255.0
-                fps = float(container.streams.video[0].average_rate)
-                print(f"[VideoObjectIterator] 视频加载成功: {len(frames)} 帧, {fps:.2f} FPS")
-                return frames_tensor, fps, len(frames)
+                # 抽帧后按步长降低帧率，保持视频时长不变
+                fps = reader.fps / frame_stride
+                print(f"[VideoObjectIterator] 视频加载成功: {builder.count} 帧, {fps:.2f} FPS")
+                return frames_tensor, fps, builder.count
         except Exception as e:
             raise IOError(f"加载或解码视频 '{video_path}' 时出错: {e}") from e
 
-    def iterate_and_return_object(self, folder_path):
-        video_files = self.get_sorted_files(folder_path)
+    def iterate_and_return_object(self, folder_path, max_side=0, output_dtype="float32", decode_backend="pyav", decode_threads=0, frame_stride=1, start_frame=0, max_frames=0, lazy_decode=False, memoize_frames=True,
+                                  prefetch_depth=0, prefetch_max_mb=0,
+                                  save_codec="libx264", save_crf=19, save_threads=0, natural_sort=False,
+                                  recursive=False, include_patterns="", exclude_patterns="", max_depth=0, resume=False, state_dir="", reset_state=False, seek_to=-1):
+        for module_name in ("comfy_api.input", "av"):
+            require(module_name)
+        from .video_objects import LazyLoadedVideo, LoadedVideo
+        scan_options = ScanOptions(recursive, include_patterns, exclude_patterns, max_depth)
+        video_files = self.get_sorted_files(folder_path, natural_sort, scan_options)
         if not video_files:
             raise FileNotFoundError(f"在文件夹 '{folder_path}' 中没有找到任何支持的视频文件。")
+        if resume:
+            self.state, self.index = IterationState.sync(self.state, "VideoObjectIterator", folder_path, video_files, self.index, state_dir, reset_state, seek_to)
+        else:
+            self.state = None
         if self.index >= len(video_files):
+            self.prefetcher.reset()
+            if self.state is not None:
+                self.state.finish(reset=False)
             print(f"所有 {len(video_files)} 个视频已处理完毕。工作流已停止。")
             return (None, None)
         filename = video_files[self.index]
         full_path = os.path.join(folder_path, filename)
         print(f"[VideoObjectIterator] 正在处理: 视频 {self.index + 1}/{len(video_files)} - {filename}")
+        encode_options = {"codec": save_codec, "crf": save_crf, "threads": save_threads}
+        # 影响解码结果的全部参数，改变时丢弃已提前解码的结果
+        load_params = (max_side, frame_stride, start_frame, max_frames, output_dtype, decode_backend, decode_threads)
+        prefetching = prefetch_depth > 0 and not lazy_decode
+        prefetched = self.prefetcher.take(self.index, filename, (folder_path, *load_params)) if prefetching else None
         try:
-            frames_tensor, fps, frame_count = self.load_video_from_path(full_path)
-            video_object = LoadedVideo(images_tensor=frames_tensor, frame_rate=fps, frame_count=frame_count)
+            if lazy_decode:
+                fps, frame_count, width, height = self.probe_video(full_path, decode_backend)
+                # 元数据按解码参数折算，真正解码后会被实际值覆盖
+                frame_count = math.ceil(max(frame_count - start_frame, 0) / frame_stride)
+                if max_frames > 0:
+                    frame_count = min(frame_count, max_frames)
+                width, height = fit_max_side(width, height, max_side)
+                video_object = LazyLoadedVideo(
+                    video_path=full_path,
+                    frame_rate=fps / frame_stride,
+                    frame_count=frame_count,
+                    width=width,
+                    height=height,
+                    decode_fn=functools.partial(self.load_video_from_path, full_path, max_side, frame_stride, start_frame, max_frames, output_dtype,
+                                                decode_backend, decode_threads),
+                    memoize=memoize_frames,
+                    passthrough=(max_side <= 0 and frame_stride == 1 and start_frame == 0 and max_frames == 0),
+                    encode_options=encode_options,
+                )
+            else:
+                if prefetched is not None:
+                    frames_tensor, fps, frame_count = prefetched.result()
+                else:
+                    frames_tensor, fps, frame_count = self.load_video_from_path(full_path, *load_params)
+                video_object = LoadedVideo(images_tensor=frames_tensor, frame_rate=fps, frame_count=frame_count, encode_options=encode_options)
         except Exception as e:
             raise e
         self.index += 1
+        if self.state is not None:
+            self.state.deliver([filename], self.index)
+        # 流水线模式：当前 VIDEO 对象交给下游后，后台开始解码接下来的视频
+        if prefetching:
+            upcoming = [(i, video_files[i]) for i in range(self.index, min(self.index + prefetch_depth, len(video_files)))]
+            self.prefetcher.schedule(upcoming, lambda name: self.load_video_from_path(os.path.join(folder_path, name), *load_params),
+                                     (folder_path, *load_params), prefetch_depth, prefetch_max_mb)
         filename_no_ext = os.path.splitext(filename)[0]
         print(f"[VideoObjectIterator] 成功创建并提供 VIDEO 对象: {filename}")
         return (video_object, filename_no_ext)
@@ -0,0 +1,245 @@
+import os
+import fractions
+import av
+import torch
+from comfy_api.input import VideoInput
+from .frame_utils import frames_to_uint8, widen_frames
+
+# --------------------------------------------------------------------------------
+# video_objects
+# VideoObjectIterator 输出的 VIDEO 对象。它们继承自 comfy_api 的 VideoInput，
+# 因此本模块只在节点第一次执行时才被导入（同时导入 av / comfy_api），
+# 注册节点时不需要加载这些依赖。
+# --------------------------------------------------------------------------------
+
+# save_to 的默认编码参数：编码器、CRF（-1 表示使用编码器默认值）、编码线程数（0 表示自动）、
+# 以及每次转换为 uint8 的帧数（决定保存时的额外内存）
+DEFAULT_ENCODE_OPTIONS = {
+    "codec": "libx264",
+    "crf": 19,
+    "threads": 0,
+    "chunk_frames": 16,
+}
+
+
+def _add_video_stream(target, rate, width, height, encode_options):
+    """按编码参数在输出容器中创建一个多线程编码的 yuv420p 视频流。"""
+    stream = target.add_stream(encode_options["codec"], rate=rate)
+    stream.width = width
+    stream.height = height
+    stream.pix_fmt = "yuv420p"
+    stream.codec_context.thread_count = encode_options["threads"]
+    stream.codec_context.thread_type = "AUTO"
+    if encode_options["crf"] >= 0:
+        stream.options = {"crf": str(encode_options["crf"])}
+    return stream
+
+
+def encode_frames(frames, filepath, frame_rate, encode_options=None):
+    """
+    把 [N, H, W, C] 帧张量（float 或 uint8）流式编码写入视频文件。
+    每次只把 chunk_frames 帧转换为 uint8 并送入编码器，额外内存只有几帧，而不是整段视频的两份拷贝。
+    """
+    encode_options = {**DEFAULT_ENCODE_OPTIONS, **(encode_options or {})}
+    # yuv420p 要求宽高为偶数，奇数时裁掉最后一行/列
+    height = frames.shape[1] - frames.shape[1] % 2
+    width = frames.shape[2] - frames.shape[2] % 2
+    rate = fractions.Fraction(frame_rate).limit_denominator(1001)
+    chunk_frames = max(1, encode_options["chunk_frames"])
+    try:
+        with av.open(filepath, "w") as target:
+            stream = _add_video_stream(target, rate, width, height, encode_options)
+            for start in range(0, frames.shape[0], chunk_frames):
+                chunk = frames_to_uint8(frames[start:start + chunk_frames, :height, :width, :3])
+                for array in chunk:
+                    for packet in stream.encode(av.VideoFrame.from_ndarray(array, format="rgb24")):
+                        target.mux(packet)
+            for packet in stream.encode():
+                target.mux(packet)
+    except Exception:
+        if os.path.exists(filepath):
+            os.remove(filepath)
+        raise
+
+# --------------------------------------------------------------------------------
+# 1. 创建一个简单的“数据容器”类，作为 VideoInputComponents 的替代品
+# --------------------------------------------------------------------------------
+class SimpleVideoComponents:
+    """一个简单的数据类，用于封装视频组件，以兼容旧版 ComfyUI API。"""
+    def __init__(self, images, frame_rate, frame_count):
+        self.images = images
+        self.frame_rate = frame_rate
+        self.frame_count = frame_count
+
+# --------------------------------------------------------------------------------
+# 2. 定义我们的具体视频类，让它返回上面创建的简单对象
+# --------------------------------------------------------------------------------
+class LoadedVideo(VideoInput):
+    """
+    一个具体的 VideoInput 实现，用于包装从文件中加载的视频数据。
+    images_tensor 可以是 uint8：此时内部只保存 uint8 帧（内存为 float32 的 1/4），
+    在 get_components() 时才转换为 [0, 1] 的 float32。
+    encode_options 为 save_to 使用的编码参数（见 DEFAULT_ENCODE_OPTIONS）。
+    """
+    def __init__(self, images_tensor: torch.Tensor, frame_rate: float, frame_count: int, encode_options: dict = None):
+        self.images = images_tensor
+        self.frame_rate = frame_rate
+        self.frame_count = frame_count
+        self.encode_options = encode_options
+
+    # --- 核心修正点 ---
+    def get_components(self):
+        """
+        实现抽象方法：返回视频的核心组件。
+        这次返回我们自己定义的 SimpleVideoComponents 对象，而不是元组。
+        """
+        return SimpleVideoComponents(
+            images=widen_frames(self.images),
+            frame_rate=self.frame_rate,
+            frame_count=self.frame_count
+        )
+
+    def get_dimensions(self) -> tuple[int, int]:
+        """返回 (宽, 高)。直接读取帧张量的形状，uint8 帧不会为此被整体转换为 float32。"""
+        return self.images.shape[2], self.images.shape[1]
+
+    def get_duration(self) -> float:
+        """返回时长（秒），同样不需要转换帧。"""
+        if not self.frame_rate:
+            return 0.0
+        return float(self.frame_count / self.frame_rate)
+
+    def save_to(self, folder: str, file_prefix: str = "ComfyUI", ext: str = "mp4") -> list[str]:
+        """
+        实现抽象方法：允许在 ComfyUI 中右键保存视频。
+        帧按块流式送入多线程编码器，保存长视频时内存不会随时长增长。
+        """
+        try:
+            filepath = os.path.join(folder, f"{file_prefix}_{self.frame_count}frames.{ext}")
+            encode_frames(self.images, filepath, self.frame_rate, self.encode_options)
+            print(f"[VideoObjectIterator] Video saved to: {filepath}")
+            return [filepath]
+        except Exception as e:
+            print(f"Error saving video: {e}")
+            return []
+
+# --------------------------------------------------------------------------------
+# 2b. 按需解码的视频类：只保存路径与探测到的元数据
+# --------------------------------------------------------------------------------
+class LazyLoadedVideo(VideoInput):
+    """
+    一个按需解码的 VideoInput 实现。
+    构造时只记录文件路径与元数据（帧率、帧数、分辨率），
+    直到第一次调用 get_components() 才真正解码帧；save_to() 直接从源容器转封装，
+    不会把帧解码到内存中。
+    """
+    def __init__(self, video_path: str, frame_rate: float, frame_count: int, width: int, height: int,
+                 decode_fn, memoize: bool = True, passthrough: bool = True, encode_options: dict = None):
+        self.video_path = video_path
+        self.frame_rate = frame_rate
+        self.frame_count = frame_count
+        self.width = width
+        self.height = height
+        # decode_fn() 返回 (frames_tensor, fps, frame_count)，frames_tensor 可以是 uint8
+        self.decode_fn = decode_fn
+        self.memoize = memoize
+        # passthrough 为 False 表示解码参数（抽帧、缩放等）改变了帧内容，保存时不能直接转封装
+        self.passthrough = passthrough
+        # 无法直接转封装时使用的编码参数
+        self.encode_options = encode_options
+        self._images = None
+
+    @property
+    def images(self):
+        return self.get_components().images
+
+    def get_components(self):
+        """
+        首次调用时解码视频；memoize 为 True 时缓存解码结果供后续调用复用。
+        缓存的是解码得到的原始精度（uint8 时只在返回时转换为 float32）。
+        """
+        frames_tensor = self._decoded_frames()
+        return SimpleVideoComponents(images=widen_frames(frames_tensor), frame_rate=self.frame_rate, frame_count=self.frame_count)
+
+    def get_dimensions(self) -> tuple[int, int]:
+        """返回 (宽, 高)。使用探测到的元数据，只查询尺寸的下游节点不会触发解码。"""
+        if self._images is not None:
+            return self._images.shape[2], self._images.shape[1]
+        return self.width, self.height
+
+    def get_duration(self) -> float:
+        """返回时长（秒）。使用探测到的帧数与帧率，不会触发解码。"""
+        if not self.frame_rate:
+            return 0.0
+        return float(self.frame_count / self.frame_rate)
+
+    def _decoded_frames(self):
+        if self._images is not None:
+            return self._images
+        frames_tensor, fps, frame_count = self.decode_fn()
+        self.frame_rate = fps
+        self.frame_count = frame_count
+        if self.memoize:
+            self._images = frames_tensor
+        return frames_tensor
+
+    def save_to(self, folder: str, file_prefix: str = "ComfyUI", ext: str = "mp4") -> list[str]:
+        """
+        实现抽象方法：允许在 ComfyUI 中右键保存视频。
+        优先直接转封装（复制压缩数据包）；目标容器不支持源编码时，逐帧流式转码。
+        """
+        filepath = os.path.join(folder, f"{file_prefix}_{self.frame_count}frames.{ext}")
+        if not self.passthrough:
+            return LoadedVideo(self._decoded_frames(), self.frame_rate, self.frame_count, self.encode_options).save_to(folder, file_prefix, ext)
+        try:
+            self._remux(filepath)
+            print(f"[VideoObjectIterator] Video remuxed to: {filepath}")
+            return [filepath]
+        except Exception as e:
+            print(f"[VideoObjectIterator] 直接转封装失败 ({e})，改为逐帧转码。")
+        try:
+            self._transcode(filepath)
+            print(f"[VideoObjectIterator] Video saved to: {filepath}")
+            return [filepath]
+        except Exception as e:
+            print(f"Error saving video: {e}")
+            if os.path.exists(filepath):
+                os.remove(filepath)
+            return []
+
+    def _remux(self, filepath):
+        """将源视频流的压缩数据包原样写入新容器。"""
+        try:
+            with av.open(self.video_path) as source, av.open(filepath, "w") as target:
+                in_stream = source.streams.video[0]
+                # PyAV 14 起 add_stream(template=...) 被 add_stream_from_template 取代
+                if hasattr(target, "add_stream_from_template"):
+                    out_stream = target.add_stream_from_template(in_stream)
+                else:
+                    out_stream = target.add_stream(template=in_stream)
+                for packet in source.demux(in_stream):
+                    # demux 结束时会产生一个用于刷新的空数据包
+                    if packet.dts is None:
+                        continue
+                    packet.stream = out_stream
+                    target.mux(packet)
+        except Exception:
+            if os.path.exists(filepath):
+                os.remove(filepath)
+            raise
+
+    def _transcode(self, filepath):
+        """逐帧解码并按 encode_options 重新编码，任何时刻内存中只有少量帧。"""
+        encode_options = {**DEFAULT_ENCODE_OPTIONS, **(self.encode_options or {})}
+        with av.open(self.video_path) as source, av.open(filepath, "w") as target:
+            in_stream = source.streams.video[0]
+            # yuv420p 要求宽高为偶数
+            width = in_stream.codec_context.width - in_stream.codec_context.width % 2
+            height = in_stream.codec_context.height - in_stream.codec_context.height % 2
+            out_stream = _add_video_stream(target, in_stream.average_rate, width, height, encode_options)
+            for frame in source.decode(in_stream):
+                frame.pts = None
+                for packet in out_stream.encode(frame.reformat(width=width, height=height, format="yuv420p")):
+                    target.mux(packet)
+            for packet in out_stream.encode():
+                target.mux(packet)
@@ -0,0 +1,177 @@
+import os
+import json
+import time
+import uuid
+import socket
+import hashlib
+
+# --------------------------------------------------------------------------------
+# work_sharding
+# 多个 ComfyUI 实例共同处理同一个（共享存储上的）文件夹时的分片逻辑，不需要任何外部协调服务。
+# - static: 按排序后的位置静态分片，第 i 个文件只由 i % shard_count == shard_index 的实例处理。
+# - dynamic: 通过共享文件系统上的租约文件动态领取文件。租约用 O_CREAT | O_EXCL 原子创建，
+#   带有过期时间；实例崩溃后，它持有的过期租约会被其他实例回收。
+#   到达列表末尾时会回头检查之前跳过的文件：回收已过期的租约，仍被其他存活实例持有的文件
+#   则轮询等待其完成或过期，所有文件都完成后才终止。
+# --------------------------------------------------------------------------------
+
+
+class LeaseManager:
+    """
+    基于租约文件的动态任务领取。
+    每个文件对应 lease_dir 下的一个 “<文件名哈希>.lease” 文件，内容为持有者、过期时间与是否已完成。
+    """
+    def __init__(self, lease_dir, lease_seconds=3600):
+        self.lease_dir = lease_dir
+        self.lease_seconds = lease_seconds
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.in_flight = []
+        # 当前实例已领取但尚未标记完成的文件，以及已知已完成的文件（完成状态不会再改变）
+        self.held = set()
+        self.done_names = set()
+        os.makedirs(lease_dir, exist_ok=True)
+
+    @classmethod
+    def for_source(cls, leases, source_path, lease_dir="", lease_seconds=3600):
+        """
+        节点每次执行时调用：返回数据源对应的租约管理器（目录改变时新建），并更新租约时长。
+        lease_dir 为空时使用文件夹内的 .leases 目录；数据源是单个文件（如分片）时放在文件旁边。
+        """
+        if not lease_dir:
+            lease_root = source_path if os.path.isdir(source_path) else os.path.dirname(source_path)
+            lease_dir = os.path.join(lease_root, ".leases")
+        if leases is None or leases.lease_dir != lease_dir:
+            leases = cls(lease_dir, lease_seconds)
+        leases.lease_seconds = lease_seconds
+        return leases
+
+    def _lease_path(self, name):
+        return os.path.join(self.lease_dir, f"{hashlib.sha1(name.encode('utf-8')).hexdigest()}.lease")
+
+    def _read(self, path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _lease_data(self, name, done=False):
+        return {"name": name, "worker": self.worker_id, "expires": time.time() + self.lease_seconds, "done": done}
+
+    def _create(self, path, name):
+        """原子地创建租约文件；文件已存在时返回 False。"""
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(self._lease_data(name), f)
+        return True
+
+    def try_claim(self, name):
+        """
+        尝试领取一个文件。已完成或被其他实例持有（未过期）的文件返回 False。
+        """
+        if name in self.done_names or name in self.held:
+            return False
+        path = self._lease_path(name)
+        if self._create(path, name):
+            self.held.add(name)
+            return True
+
+        info = self._read(path)
+        if info is not None and info.get("done"):
+            self.done_names.add(name)
+            return False
+        # 租约文件正在被其他实例写入（内容暂不完整）时按“被持有”处理
+        if info is None or info.get("expires", 0) > time.time():
+            return False
+
+        # 租约已过期：先把它原子地重命名走（只有一个实例能成功），再重新创建
+        stale_path = f"{path}.{self.worker_id}.stale"
+        try:
+            os.rename(path, stale_path)
+        except OSError:
+            return False
+        stale_info = self._read(stale_path)
+        if stale_info is None or stale_info.get("done") or stale_info.get("expires", 0) > time.time():
+            # 读取与重命名之间租约已被其他实例重新领取或完成：放回原处
+            os.replace(stale_path, path)
+            return False
+        os.remove(stale_path)
+        print(f"[LeaseManager] 回收了过期租约: {name}（原持有者 {stale_info.get('worker')}）")
+        if self._create(path, name):
+            self.held.add(name)
+            return True
+        return False
+
+    def claim_leftover(self, files, wait=True, poll_interval=5.0):
+        """
+        到达列表末尾时回头领取之前跳过、但仍未完成的文件（例如崩溃实例留下的过期租约）。
+        返回领取到的位置；所有文件都已完成时返回 len(files)。
+        仍有文件被其他存活实例持有时，wait 为 True 则轮询等待它们完成或过期，否则直接返回 len(files)。
+        """
+        pending = [i for i, name in enumerate(files) if name not in self.done_names and name not in self.held]
+        reported = None
+        while pending:
+            still_pending = []
+            for i in pending:
+                if self.try_claim(files[i]):
+                    return i
+                if files[i] not in self.done_names:
+                    still_pending.append(i)
+            pending = still_pending
+            if not pending or not wait:
+                break
+            if len(pending) != reported:
+                reported = len(pending)
+                print(f"[LeaseManager] 还有 {reported} 个文件被其他实例持有，等待它们完成或租约过期...")
+            time.sleep(poll_interval)
+        return len(files)
+
+    def deliver(self, names):
+        """记录本次输出的文件；下一次执行节点时会被标记为已完成。"""
+        self.in_flight = list(names)
+
+    def commit_in_flight(self):
+        """把上一次输出的文件标记为已完成，其他实例将不再领取它们。"""
+        for name in self.in_flight:
+            path = self._lease_path(name)
+            tmp_path = f"{path}.{self.worker_id}.tmp"
+            try:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(self._lease_data(name, done=True), f)
+                os.replace(tmp_path, path)
+            except OSError as e:
+                print(f"[LeaseManager] 标记完成失败: {name} - {e}")
+                continue
+            self.held.discard(name)
+            self.done_names.add(name)
+        self.in_flight = []
+
+
+def next_shard_index(files, index, sharding_mode, shard_index=0, shard_count=1, leases=None, wait=True):
+    """
+    从 index 开始寻找下一个属于当前实例的文件位置；没有时返回 len(files)。
+    dynamic 模式下找到的文件已被当前实例领取；到达末尾时回头领取未完成的文件
+    （见 LeaseManager.claim_leftover，wait 为 False 时不等待其他实例持有的文件）。
+    static 模式下 shard_index 必须小于 shard_count，否则多个实例会处理相同的文件。
+    """
+    if sharding_mode == "static":
+        if not 0 <= shard_index < shard_count:
+            raise ValueError(f"shard_index ({shard_index}) 必须在 0 到 shard_count - 1 ({shard_count - 1}) 之间。")
+        if shard_count <= 1:
+            return index
+        remainder = index % shard_count
+        if remainder != shard_index:
+            index += (shard_index - remainder) % shard_count
+        return min(index, len(files))
+
+    if sharding_mode == "dynamic":
+        while index < len(files) and not leases.try_claim(files[index]):
+            index += 1
+        if index >= len(files):
+            index = leases.claim_leftover(files, wait)
+        return index
+
+    return index